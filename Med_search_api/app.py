@@ -3,12 +3,23 @@ AI Web Search API for Medicine Deals
 -----------------------------------
 
 Dependencies (install):
-    pip install fastapi uvicorn httpx pydantic python-dotenv
+    pip install fastapi uvicorn "httpx[http2]" pydantic python-dotenv
 
 Environment variables (.env or system):
     GOOGLE_API_KEY=your_google_api_key
     GOOGLE_CX=your_custom_search_engine_id
     SERPAPI_API_KEY=your_serpapi_key   # optional; enables Shopping offers
+    HTTP_MAX_CONNECTIONS=100           # optional; shared outbound connection pool size
+    HTTP_MAX_KEEPALIVE=20              # optional; idle keep-alive connections kept open
+    BULK_CONCURRENCY=8                 # optional; unique queries searched at once by /search_bulk
+    OFFER_CACHE_TTL=21600              # optional; seconds a cached result is fresh
+    OFFER_CACHE_STALE=86400            # optional; extra seconds a stale result is served while it refreshes
+    OFFER_CACHE_SIZE=1000              # optional; queries kept in memory
+    OFFER_CACHE_PATH=offers.sqlite3    # optional; persist the cache to SQLite
+    SEARCH_BUDGET_SECONDS=8            # optional; total wait per query before answering with partial offers
+    SERPAPI_DEADLINE_SECONDS=6         # optional; longest wait for SerpApi within the budget
+    GOOGLE_CSE_DEADLINE_SECONDS=4      # optional; longest wait for Google CSE within the budget
+    HEDGE_AFTER_SECONDS=0              # optional; >0 sends a duplicate request to a provider this slow
 
 Run (dev):
     uvicorn ai_medicine_search_api:app --reload --port 8000
@@ -16,24 +27,60 @@ Run (dev):
 Endpoints:
     POST /search        -> {"query": "paracetamol 500 mg"}
     POST /search_bulk   -> {"queries": ["paracetamol 500 mg", "ibuprofen 200 mg"]}
+    POST /search_bulk/stream -> same body; NDJSON, one {"index": i, ...SearchResponse} line per query
+                                as soon as it completes, then a {"summary": {...}} line
 """
 
 from __future__ import annotations
 
+import asyncio
+import json
 import os
 import re
+from contextlib import asynccontextmanager
 from typing import List, Optional, Dict, Any
 
 import httpx
 from fastapi import FastAPI, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware  # ← ADD THIS
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
+from offer_cache import OfferCache
+
+# ------------------------
+# Shared HTTP client (one connection pool for every provider and request)
+# ------------------------
+try:
+    import h2  # noqa: F401  (installed by httpx[http2])
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+        max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        keepalive_expiry=60,
+    )
+    async with httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE, limits=limits, timeout=20, headers={"User-Agent": USER_AGENT}
+    ) as client:
+        app.state.http_client = client
+        yield
+
+
+def http_client() -> httpx.AsyncClient:
+    return app.state.http_client
+
 # ------------------------
 # CORS FIX - ALLOW NEXT.JS (localhost:3000)
 # ------------------------
-app = FastAPI(title="AI Medicine Web Search API", version="1.0.0")
+app = FastAPI(title="AI Medicine Web Search API", version="1.0.0", lifespan=lifespan)
 
 # ADD THIS BLOCK - CORS MIDDLEWARE
 app.add_middleware(
@@ -56,6 +103,20 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 GOOGLE_CX = os.getenv("GOOGLE_CX")
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY")
+BULK_CONCURRENCY = max(1, int(os.getenv("BULK_CONCURRENCY", "8")))
+SEARCH_BUDGET_SECONDS = float(os.getenv("SEARCH_BUDGET_SECONDS", "8"))
+PROVIDER_DEADLINES = {
+    "serpapi": float(os.getenv("SERPAPI_DEADLINE_SECONDS", "6")),
+    "google_cse": float(os.getenv("GOOGLE_CSE_DEADLINE_SECONDS", "4")),
+}
+HEDGE_AFTER_SECONDS = float(os.getenv("HEDGE_AFTER_SECONDS", "0"))
+
+offer_cache = OfferCache(
+    maxsize=int(os.getenv("OFFER_CACHE_SIZE", "1000")),
+    ttl=float(os.getenv("OFFER_CACHE_TTL", "21600")),
+    stale_ttl=float(os.getenv("OFFER_CACHE_STALE", "86400")),
+    path=os.getenv("OFFER_CACHE_PATH") or None,
+)
 
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
@@ -77,6 +138,10 @@ class SearchResponse(BaseModel):
     query: str
     best_offer: Optional[Offer] = None
     offers: List[Offer] = Field(default_factory=list)
+    cache_age: Optional[float] = Field(default=None, description="Seconds since this result was fetched; null if fetched just now")
+    stale: bool = False
+    missing_providers: List[str] = Field(default_factory=list, description="Providers that had not answered within the deadline")
+    partial: bool = False
 
 class QueryBody(BaseModel):
     query: str = Field(..., description="Medicine name and spec, e.g., 'paracetamol 500 mg 10 tablets'")
@@ -100,6 +165,18 @@ CURRENCY_MAP = {
     "gbp": "GBP",
 }
 
+UNIT_REGEX = re.compile(r"(?i)(\d+(?:\.\d+)?)\s*(mg|mcg|µg|ug|gms|gm|g|ml|iu|%)(?![a-z])")
+UNIT_MAP = {"µg": "mcg", "ug": "mcg", "gms": "g", "gm": "g"}
+
+def _format_unit(m: re.Match) -> str:
+    unit = UNIT_MAP.get(m.group(2), m.group(2))
+    return f"{m.group(1)}%" if unit == "%" else f"{m.group(1)} {unit}"
+
+def normalize_query(query: str) -> str:
+    """'Paracetamol  500MG' and 'paracetamol 500 mg' -> 'paracetamol 500 mg'."""
+    return UNIT_REGEX.sub(_format_unit, " ".join(query.lower().split()))
+
+
 def parse_price(text: str) -> tuple[Optional[float], Optional[str]]:
     if not text:
         return None, None
@@ -137,8 +214,7 @@ async def search_serpapi_shopping(query: str) -> List[Offer]:
         "gl": "in",
     }
     url = "https://serpapi.com/search.json"
-    async with httpx.AsyncClient(timeout=60, headers={"User-Agent": USER_AGENT}) as client:
-        r = await client.get(url, params=params)
+    r = await http_client().get(url, params=params, timeout=60)
     if r.status_code != 200:
         return []
     data = r.json()
@@ -174,8 +250,7 @@ async def search_google_cse(query: str) -> List[Offer]:
         "num": 10,
     }
     url = "https://www.googleapis.com/customsearch/v1"
-    async with httpx.AsyncClient(timeout=20, headers={"User-Agent": USER_AGENT}) as client:
-        r = await client.get(url, params=params)
+    r = await http_client().get(url, params=params, timeout=20)
     if r.status_code != 200:
         return []
     data = r.json()
@@ -200,10 +275,19 @@ async def search_google_cse(query: str) -> List[Offer]:
     return offers
 
 
-async def aggregate_offers(query: str) -> SearchResponse:
+PROVIDERS = {
+    "serpapi": search_serpapi_shopping,
+    "google_cse": search_google_cse,
+}
+
+# Provider calls still running after their request answered; kept referenced until done.
+_background: set = set()
+# The same, by normalized query, so refresh_in_background can wait for them.
+_completing: Dict[str, "asyncio.Task[None]"] = {}
+
+
+def merge_offers(query: str, serpapi_offers: List[Offer], cse_offers: List[Offer]) -> SearchResponse:
     offers: List[Offer] = []
-    serpapi_offers = await search_serpapi_shopping(query)
-    cse_offers = await search_google_cse(query)
     offers.extend(serpapi_offers)
     seen: set[str] = set()
     unique_offers = []
@@ -218,6 +302,129 @@ async def aggregate_offers(query: str) -> SearchResponse:
     best = choose_best(unique_offers)
     return SearchResponse(query=query, best_offer=best, offers=unique_offers)
 
+
+async def hedged(provider, query: str) -> List[Offer]:
+    """Calls the provider; if it is slower than HEDGE_AFTER_SECONDS, races a second identical call."""
+    first = asyncio.create_task(provider(query))
+    if HEDGE_AFTER_SECONDS <= 0:
+        return await first
+    second = None
+    try:
+        done, _ = await asyncio.wait({first}, timeout=HEDGE_AFTER_SECONDS)
+        if done:
+            return first.result()
+        second = asyncio.create_task(provider(query))
+        done, pending = await asyncio.wait({first, second}, return_when=asyncio.FIRST_COMPLETED)
+        winner = done.pop()
+        if winner.exception() is not None and pending:
+            winner = (await asyncio.wait(pending))[0].pop()
+        return winner.result()
+    finally:
+        for task in (first, second):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def aggregate_offers(query: str) -> SearchResponse:
+    """
+    Runs every provider at once. Each gets min(its deadline, what is left of
+    SEARCH_BUDGET_SECONDS); offers that arrived in time are returned and the
+    others are listed in missing_providers. Late providers keep running in
+    the background and the complete result is written to the cache.
+    """
+    loop = asyncio.get_running_loop()
+    budget_end = loop.time() + SEARCH_BUDGET_SECONDS
+    tasks = {name: asyncio.create_task(hedged(provider, query)) for name, provider in PROVIDERS.items()}
+
+    async def within_deadline(name: str) -> Optional[List[Offer]]:
+        timeout = max(0.0, min(PROVIDER_DEADLINES[name], budget_end - loop.time()))
+        try:
+            return await asyncio.wait_for(asyncio.shield(tasks[name]), timeout)
+        except asyncio.TimeoutError:
+            return None
+        except Exception as e:
+            print(f"Provider {name} failed for '{query}': {e!r}")
+            return []
+
+    results = dict(zip(tasks, await asyncio.gather(*(within_deadline(name) for name in tasks))))
+    missing = [name for name, offers in results.items() if offers is None]
+    response = merge_offers(query, results["serpapi"] or [], results["google_cse"] or [])
+    if missing:
+        response.missing_providers = missing
+        response.partial = True
+        key = normalize_query(query)
+        task = asyncio.create_task(complete_in_background(query, tasks))
+        _background.add(task)
+        _completing[key] = task
+        task.add_done_callback(_background.discard)
+        task.add_done_callback(lambda _: _completing.pop(key, None))
+    return response
+
+
+async def complete_in_background(query: str, tasks: Dict[str, "asyncio.Task[List[Offer]]"]) -> None:
+    """Waits for the late providers and caches the complete result."""
+    outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+    results = {name: ([] if isinstance(o, BaseException) else o) for name, o in zip(tasks, outcomes)}
+    response = merge_offers(query, results["serpapi"], results["google_cse"])
+    if response.offers:
+        offer_cache.set(normalize_query(query), jsonable_encoder(response))
+
+# ------------------------
+# Cache (stale-while-revalidate)
+# ------------------------
+_refreshing: Dict[str, "asyncio.Task[SearchResponse]"] = {}
+
+
+async def fetch_and_cache(key: str) -> SearchResponse:
+    result = await aggregate_offers(key)
+    # Don't pin an empty answer (e.g. a provider outage) for a whole TTL; partial
+    # answers are cached by complete_in_background once the late provider is done.
+    if result.offers and not result.partial:
+        offer_cache.set(key, jsonable_encoder(result))
+    return result
+
+
+def refresh_in_background(key: str) -> None:
+    """
+    Start (at most one) provider fetch for `key`; callers may await _refreshing[key].
+    A partial answer stays in _refreshing until the late providers finish and
+    the full result is cached, so identical requests meanwhile get the partial
+    answer instead of starting another provider round trip.
+    """
+    if key in _refreshing:
+        return
+    task = asyncio.create_task(fetch_and_cache(key))
+    _refreshing[key] = task
+
+    def release(_: object = None) -> None:
+        if _refreshing.get(key) is task:
+            del _refreshing[key]
+
+    def done(t: "asyncio.Task[SearchResponse]") -> None:
+        completing = _completing.get(key)
+        if completing is not None and not completing.done():
+            completing.add_done_callback(release)
+        else:
+            release()
+        if not t.cancelled() and t.exception():
+            print(f"Background refresh failed for '{key}': {t.exception()!r}")
+
+    task.add_done_callback(done)
+
+
+async def cached_offers(query: str) -> SearchResponse:
+    """Fresh hit -> cached result; stale hit -> cached result now, refreshed in the background; miss -> search."""
+    key = normalize_query(query)
+    entry = offer_cache.get(key)
+    if entry is not None:
+        data, age, stale = entry
+        if stale:
+            refresh_in_background(key)
+        return SearchResponse(**dict(data, cache_age=round(age, 1), stale=stale))
+    # Concurrent misses for the same query share one provider round trip.
+    refresh_in_background(key)
+    return await asyncio.shield(_refreshing[key])
+
 # ------------------------
 # API
 # ------------------------
@@ -225,7 +432,8 @@ async def aggregate_offers(query: str) -> SearchResponse:
 async def search(body: QueryBody):
     if not (SERPAPI_API_KEY or (GOOGLE_API_KEY and GOOGLE_CX)):
         raise HTTPException(status_code=500, detail="No search provider configured. Set SERPAPI_API_KEY or GOOGLE_API_KEY+GOOGLE_CX.")
-    return await aggregate_offers(body.query)
+    result = await cached_offers(body.query)
+    return SearchResponse(**dict(jsonable_encoder(result), query=body.query))
 
 @app.post("/search_bulk", response_model=List[SearchResponse])
 async def search_bulk(body: BulkQueryBody):
@@ -233,10 +441,69 @@ async def search_bulk(body: BulkQueryBody):
         return []
     if not (SERPAPI_API_KEY or (GOOGLE_API_KEY and GOOGLE_CX)):
         raise HTTPException(status_code=500, detail="No search provider configured. Set SERPAPI_API_KEY or GOOGLE_API_KEY+GOOGLE_CX.")
-    results: List[SearchResponse] = []
-    for q in body.queries:
-        results.append(await aggregate_offers(q))
-    return results
+    # Each distinct normalized query is searched once, BULK_CONCURRENCY at a time.
+    normalized = [normalize_query(q) for q in body.queries]
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def limited(query: str) -> SearchResponse:
+        async with semaphore:
+            return await cached_offers(query)
+
+    unique = list(dict.fromkeys(normalized))
+    by_query = dict(zip(unique, await asyncio.gather(*(limited(q) for q in unique))))
+    return [
+        SearchResponse(**dict(jsonable_encoder(by_query[n]), query=q))
+        for q, n in zip(body.queries, normalized)
+    ]
+
+async def stream_bulk_lines(queries: List[str]):
+    """
+    NDJSON lines in completion order. A fixed pool of BULK_CONCURRENCY workers
+    pulls from the query list and a bounded queue hands lines to the client,
+    so memory stays flat however long the list is.
+    """
+    queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue(maxsize=BULK_CONCURRENCY)
+    pending = iter(enumerate(queries))
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        for index, query in pending:
+            try:
+                result = await cached_offers(query)
+                line = json.dumps({"index": index, **jsonable_encoder(result), "query": query})
+            except Exception as e:
+                errors += 1
+                line = json.dumps({"index": index, "query": query, "error": str(e)})
+            await queue.put(line)
+
+    async def run_workers() -> None:
+        cancelled = False
+        try:
+            await asyncio.gather(*(worker() for _ in range(min(BULK_CONCURRENCY, len(queries)))))
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # After a cancel nobody reads the queue, and put() on a full one would never return.
+            if not cancelled:
+                await queue.put(None)
+
+    runner = asyncio.create_task(run_workers())
+    try:
+        while (line := await queue.get()) is not None:
+            yield line + "\n"
+        yield json.dumps({"summary": {"queries": len(queries), "errors": errors}}) + "\n"
+    finally:
+        # Client went away: stop searching the rest of the list.
+        runner.cancel()
+
+
+@app.post("/search_bulk/stream")
+async def search_bulk_stream(body: BulkQueryBody):
+    if not (SERPAPI_API_KEY or (GOOGLE_API_KEY and GOOGLE_CX)):
+        raise HTTPException(status_code=500, detail="No search provider configured. Set SERPAPI_API_KEY or GOOGLE_API_KEY+GOOGLE_CX.")
+    return StreamingResponse(stream_bulk_lines(body.queries), media_type="application/x-ndjson")
 
 # ------------------------
 # Health
@@ -247,4 +514,4 @@ async def health():
         "serpapi": bool(SERPAPI_API_KEY),
         "google_cse": bool(GOOGLE_API_KEY and GOOGLE_CX),
     }
-    return {"status": "ok", "providers": providers}
\ No newline at end of file
+    return {"status": "ok", "providers": providers, "http2": HTTP2_AVAILABLE, "cache": offer_cache.stats()}
\ No newline at end of file
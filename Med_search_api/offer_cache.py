@@ -0,0 +1,91 @@
+"""
+Offer cache for the medicine search API.
+
+Bounded in-memory LRU of search results keyed on the normalized query, with
+optional SQLite persistence so results survive restarts. Entries are fresh
+for `ttl` seconds, then stale (still served, while the caller refreshes them
+in the background) for another `stale_ttl` seconds, then dropped.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class OfferCache:
+    def __init__(self, maxsize: int = 1000, ttl: float = 21600, stale_ttl: float = 86400, path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.path = path
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS offers (query TEXT PRIMARY KEY, stored_at REAL, data TEXT)"
+            )
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float, bool]]:
+        """Returns (data, age_seconds, is_stale), or None if missing or too old to serve."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT stored_at, data FROM offers WHERE query = ?", (key,)).fetchone()
+                if row:
+                    entry = (row[0], json.loads(row[1]))
+                    self._remember(key, entry)
+            if entry is None or now - entry[0] > self.ttl + self.stale_ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            age = now - entry[0]
+            stale = age > self.ttl
+            if stale:
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            return entry[1], age, stale
+
+    def set(self, key: str, data: Dict[str, Any]) -> None:
+        entry = (time.time(), data)
+        with self._lock:
+            self._remember(key, entry)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO offers (query, stored_at, data) VALUES (?, ?, ?)",
+                    (key, entry[0], json.dumps(data)),
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, entry: Tuple[float, Dict[str, Any]]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "stale_ttl_seconds": self.stale_ttl,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+                "sqlite_path": self.path,
+            }
@@ -1,12 +1,22 @@
 import os
+import sys
 import requests
 import json
-from flask import Flask, request, jsonify
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
 import google.generativeai as genai
 import time
 
+from label_cache import LabelStore, TTLCache, fingerprint, normalize_drug_name
+from label_retrieval import LabelIndex
+from label_snapshot import LabelSnapshot
+from prescreen import PatientScreen
+from llm_guard import CircuitBreaker, RateLimitTimeout, TokenBucket, render_metrics
+from response_utils import LABEL_SECTION_KEYS, finalize_response, parse_fields, shape_report
+
 # --- Configuration ---
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -71,6 +81,16 @@ model = genai.GenerativeModel(
 app = Flask(__name__)
 CORS(app) # Enable CORS
 
+# Characters of each label section kept in fullData when a client asks for ?compact=1.
+LABEL_PREVIEW_CHARS = int(os.getenv("LABEL_PREVIEW_CHARS", "300"))
+
+@app.after_request
+def compress_and_tag(response):
+    """ETag / conditional GET and gzip or brotli for every JSON response."""
+    return finalize_response(
+        response, request.method, request.headers.get("If-None-Match"), request.headers.get("Accept-Encoding")
+    )
+
 # --- "AI" KNOWLEDGE BASE ---
 COMMON_BP_DRUGS = [
     {"class": "ACE Inhibitor", "name": "Lisinopril"},
@@ -80,15 +100,180 @@ COMMON_BP_DRUGS = [
     {"class": "Diuretic", "name": "Hydrochlorothiazide"}
 ]
 
+# Number of drugs analyzed at the same time in /generate-report.
+REPORT_CONCURRENCY = max(1, int(os.getenv("REPORT_CONCURRENCY", "5")))
+
+# --- openFDA Label Cache ---
+# Labels change on the order of weeks, so parsed labels are kept in memory
+# and in SQLite. Set LABEL_CACHE_PATH to an empty string to disable the disk tier.
+LABEL_CACHE_TTL = float(os.getenv("LABEL_CACHE_TTL", str(7 * 24 * 3600)))
+LABEL_CACHE_PATH = os.getenv("LABEL_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "label_cache.sqlite3"))
+
+label_memory_cache = TTLCache(maxsize=int(os.getenv("LABEL_CACHE_SIZE", "256")), ttl=LABEL_CACHE_TTL)
+label_store = LabelStore(LABEL_CACHE_PATH, LABEL_CACHE_TTL) if LABEL_CACHE_PATH else None
+
+# --- Label Source ---
+# "api": openFDA (default). "snapshot": only the local snapshot built by
+# label_snapshot.py (no network). "hybrid": snapshot first, openFDA for misses.
+LABEL_SOURCE = os.getenv("LABEL_SOURCE", "api").lower()
+LABEL_SNAPSHOT_PATH = os.getenv("LABEL_SNAPSHOT_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "label_snapshot.bin"))
+if LABEL_SOURCE not in ("api", "snapshot", "hybrid"):
+    raise ValueError(f"Unknown LABEL_SOURCE '{LABEL_SOURCE}'. Use api, snapshot or hybrid.")
+label_snapshot = LabelSnapshot(LABEL_SNAPSHOT_PATH) if LABEL_SOURCE != "api" else None
+
+# --- Shared openFDA HTTP Session ---
+# One keep-alive session (and connection pool) for all openFDA traffic.
+OPENFDA_LABEL_URL = "https://api.fda.gov/drug/label.json"
+OPENFDA_POOL_SIZE = int(os.getenv("OPENFDA_POOL_SIZE", "10"))
+# Max drug names OR-ed into one openFDA query, and how many labels it may return.
+OPENFDA_BATCH_SIZE = int(os.getenv("OPENFDA_BATCH_SIZE", "20"))
+OPENFDA_BATCH_LIMIT = int(os.getenv("OPENFDA_BATCH_LIMIT", "100"))
+
+http_session = requests.Session()
+_openfda_adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=OPENFDA_POOL_SIZE)
+http_session.mount("https://", _openfda_adapter)
+http_session.mount("http://", _openfda_adapter)
+
+# --- Label Context Pre-filtering ---
+# Token budget for the label text sent with each analysis (0 sends the full label).
+LABEL_CONTEXT_TOKENS = int(os.getenv("LABEL_CONTEXT_TOKENS", "1500"))
+label_index_cache = TTLCache(maxsize=int(os.getenv("LABEL_CACHE_SIZE", "256")), ttl=LABEL_CACHE_TTL)
+label_context_stats = {"calls": 0, "labelTokens": 0, "promptTokens": 0, "tokensSaved": 0}
+label_context_lock = threading.Lock()
+
+# --- Allergy / Interaction Pre-screen ---
+# When the local pre-screen finds a 🔴 CONTRAINDICATION, skip Gemini for that drug.
+PRESCREEN_SKIP_LLM = os.getenv("PRESCREEN_SKIP_LLM", "1") == "1"
+
+# --- Gemini Rate Limiter & Circuit Breaker ---
+# Shared by every thread that calls Gemini; size GEMINI_RPM/GEMINI_BURST to the API quota.
+gemini_limiter = TokenBucket(
+    rate_per_minute=float(os.getenv("GEMINI_RPM", "15")),
+    burst=int(os.getenv("GEMINI_BURST", "5"))
+)
+# Longest a call may queue for the limiter before giving up.
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+gemini_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+)
+
+# --- Analysis Cache ---
+# Gemini findings keyed on (normalized profile text, label sections). Size 0 disables it.
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "1024"))
+analysis_cache = TTLCache(maxsize=ANALYSIS_CACHE_SIZE, ttl=int(os.getenv("ANALYSIS_CACHE_TTL", "86400")))
+ANALYZED_LABEL_SECTIONS = ("genericName", "contraindications", "warnings_and_precautions", "drugInteractions", "adverseReactions")
+
 # --- Helper Functions ---
 
+def get_cached_label(key):
+    """Looks a normalized drug name up in memory, then the local snapshot (if
+    enabled), then the SQLite store."""
+    drug_data = label_memory_cache.get(key)
+    if drug_data is not None:
+        return drug_data
+
+    if label_snapshot is not None:
+        label = label_snapshot.get(key)
+        if label is not None:
+            drug_data = parse_label(label, key)
+            label_memory_cache.set(key, drug_data)
+            return drug_data
+
+    if label_store is not None:
+        stored = label_store.get(key)
+        if stored is not None:
+            drug_data, _, fetched_at = stored
+            # Only keep it in memory for what is left of its disk TTL.
+            label_memory_cache.set(key, drug_data, ttl=LABEL_CACHE_TTL - (time.time() - fetched_at))
+            return drug_data
+    return None
+
+def cache_label(key, drug_data):
+    label_memory_cache.set(key, drug_data)
+    if label_store is not None:
+        label_store.put(key, drug_data, drug_data.get("labelVersion"))
+
 def fetch_drug_data(drug_name):
+    """Returns parsed label data, from the memory cache, the SQLite store, or openFDA."""
+    key = normalize_drug_name(drug_name)
+    drug_data = get_cached_label(key)
+    if drug_data is not None:
+        return drug_data
+
+    if LABEL_SOURCE == "snapshot":
+        return None
+    drug_data = fetch_drug_data_from_api(drug_name)
+    if drug_data is not None:
+        cache_label(key, drug_data)
+    return drug_data
+
+def fetch_drug_data_batch(drug_names):
+    """
+    Resolves many drug names at once: cache hits first, then one openFDA query
+    per OPENFDA_BATCH_SIZE misses. Returns {drug_name: drug_data or None}.
+    """
+    results = {}
+    missing = []
+    for drug_name in drug_names:
+        drug_data = get_cached_label(normalize_drug_name(drug_name))
+        if drug_data is not None:
+            results[drug_name] = drug_data
+        elif drug_name not in missing:
+            missing.append(drug_name)
+    if LABEL_SOURCE == "snapshot":
+        missing = []
+
+    for start in range(0, len(missing), OPENFDA_BATCH_SIZE):
+        chunk = missing[start:start + OPENFDA_BATCH_SIZE]
+        fetched = fetch_drug_data_batch_from_api(chunk)
+        for drug_name in chunk:
+            drug_data = fetched.get(drug_name)
+            if drug_data is None and drug_name not in fetched:
+                # The batch came back without this name (e.g. crowded out by
+                # another drug's labels), so fall back to a single lookup.
+                drug_data = fetch_drug_data_from_api(drug_name)
+            if drug_data is not None:
+                cache_label(normalize_drug_name(drug_name), drug_data)
+            results[drug_name] = drug_data
+    return {drug_name: results.get(drug_name) for drug_name in drug_names}
+
+def prewarm_label_cache():
+    """Loads COMMON_BP_DRUGS into the label cache so the first report skips openFDA."""
+    labels = fetch_drug_data_batch([drug_def["name"] for drug_def in COMMON_BP_DRUGS])
+    for drug_name, drug_data in labels.items():
+        if drug_data is None:
+            print(f"Pre-warm: could not load label for {drug_name}")
+    print(f"Pre-warmed label cache for {len(labels)} drugs.")
+
+def openfda_name_clause(drug_name):
+    return f'openfda.generic_name.exact:"{drug_name.upper()}" OR openfda.brand_name.exact:"{drug_name.upper()}"'
+
+def parse_label(drug, drug_name):
+    """Keeps only the label sections the analysis uses."""
+    def get_section_text(section_key):
+        section_data = drug.get(section_key)
+        if isinstance(section_data, list) and section_data:
+            return " ".join(section_data).lower()
+        return "No information listed."
+
+    return {
+        "brandName": ", ".join(drug.get("openfda", {}).get("brand_name", ["N/A"])),
+        "genericName": ", ".join(drug.get("openfda", {}).get("generic_name", [drug_name])),
+        "contraindications": get_section_text("contraindications"),
+        "warnings_and_precautions": get_section_text("warnings_and_precautions"),
+        "drugInteractions": get_section_text("drug_interactions"),
+        "adverseReactions": get_section_text("adverse_reactions"),
+        "labelVersion": f"{drug.get('effective_time', 'unknown')}/v{drug.get('version', '?')}"
+    }
+
+def fetch_drug_data_from_api(drug_name):
     """Fetches drug data from openFDA."""
-    search_field = f'(openfda.generic_name.exact:"{drug_name.upper()}" OR openfda.brand_name.exact:"{drug_name.upper()}")'
-    url = f"https://api.fda.gov/drug/label.json?search={search_field}&limit=1"
+    search_field = f'({openfda_name_clause(drug_name)})'
+    url = f"{OPENFDA_LABEL_URL}?search={search_field}&limit=1"
     
     try:
-        response = requests.get(url, timeout=10)
+        response = http_session.get(url, timeout=10)
         response.raise_for_status()
         data = response.json()
         
@@ -96,48 +281,142 @@ def fetch_drug_data(drug_name):
             print(f"No results found for {drug_name}")
             return None
             
-        drug = data["results"][0]
-        
-        def get_section_text(section_key):
-            section_data = drug.get(section_key)
-            if isinstance(section_data, list) and section_data:
-                return " ".join(section_data).lower()
-            return "No information listed."
-
-        return {
-            "brandName": ", ".join(drug.get("openfda", {}).get("brand_name", ["N/A"])),
-            "genericName": ", ".join(drug.get("openfda", {}).get("generic_name", [drug_name])),
-            "contraindications": get_section_text("contraindications"),
-            "warnings_and_precautions": get_section_text("warnings_and_precautions"),
-            "drugInteractions": get_section_text("drug_interactions"),
-            "adverseReactions": get_section_text("adverse_reactions")
-        }
+        return parse_label(data["results"][0], drug_name)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data for {drug_name}: {e}")
         return None
 
-def analyze_with_llm(patient_profile_text, drug_data):
+def fetch_drug_data_batch_from_api(drug_names):
+    """
+    One openFDA query for several drugs (OR of their generic/brand clauses),
+    demultiplexed back to the requested names. Names with no matching label
+    are mapped to None only when the response clearly covered them (fewer
+    results than the limit); otherwise they are left out so the caller can
+    retry them one by one.
+    """
+    if not drug_names:
+        return {}
+    search_field = "(" + " OR ".join(openfda_name_clause(name) for name in drug_names) + ")"
+    url = f"{OPENFDA_LABEL_URL}?search={search_field}&limit={OPENFDA_BATCH_LIMIT}"
+
+    try:
+        response = http_session.get(url, timeout=15)
+        if response.status_code == 404:
+            # openFDA answers 404 when nothing matched at all.
+            return {drug_name: None for drug_name in drug_names}
+        response.raise_for_status()
+        labels = response.json().get("results", [])
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching batch data for {', '.join(drug_names)}: {e}")
+        return {}
+
+    wanted = {drug_name.upper(): drug_name for drug_name in drug_names}
+    found = {}
+    for drug in labels:
+        openfda = drug.get("openfda", {})
+        label_names = {n.upper() for n in openfda.get("generic_name", []) + openfda.get("brand_name", [])}
+        for upper_name, drug_name in wanted.items():
+            if drug_name not in found and upper_name in label_names:
+                found[drug_name] = parse_label(drug, drug_name)
+
+    if len(labels) < OPENFDA_BATCH_LIMIT:
+        for drug_name in drug_names:
+            found.setdefault(drug_name, None)
+    return found
+
+def build_label_context(patient_profile_text, drug_data):
+    """
+    Picks the label passages relevant to this profile (BM25 over sentences,
+    capped at LABEL_CONTEXT_TOKENS). Returns (sections, stats).
+    """
+    index_key = (drug_data["genericName"], drug_data.get("labelVersion"))
+    index = label_index_cache.get(index_key)
+    if index is None:
+        index = LabelIndex(drug_data)
+        label_index_cache.set(index_key, index)
+
+    sections, stats = index.select(patient_profile_text, LABEL_CONTEXT_TOKENS)
+    with label_context_lock:
+        label_context_stats["calls"] += 1
+        for key in ("labelTokens", "promptTokens", "tokensSaved"):
+            label_context_stats[key] += stats[key]
+    print(f"Label context for {drug_data['genericName']}: {stats['promptTokens']}/{stats['labelTokens']} "
+          f"tokens sent ({stats['tokensSaved']} saved)")
+    return sections, stats
+
+def analysis_cache_key(patient_profile_text, drug_data):
+    """Same profile (ignoring case/whitespace) + same label text + same prompt settings -> same key."""
+    profile = " ".join(patient_profile_text.lower().split())
+    label = fingerprint({section: drug_data.get(section) for section in ANALYZED_LABEL_SECTIONS})
+    return fingerprint([profile, label, LABEL_CONTEXT_TOKENS, PRESCREEN_SKIP_LLM])
+
+def report_shaper():
+    """Reads ?compact=1 and ?fields=a,b from the request; returns a (report, drug name) -> report function."""
+    compact = request.args.get("compact", "").lower() in ("1", "true", "yes")
+    fields = parse_fields(request.args.get("fields"))
+    return lambda report, drug_name: shape_report(report, drug_name, compact, fields, LABEL_PREVIEW_CHARS)
+
+def wants_cache_bypass():
+    """?bypassCache=1 forces a fresh Gemini analysis (the new result is still cached)."""
+    return request.args.get("bypassCache", "").lower() in ("1", "true", "yes")
+
+def degraded_analysis(cache_key, local_alerts):
+    """Result used while Gemini is unavailable: a cached analysis if there is
+    one (even when the caller asked to bypass the cache), else the local
+    pre-screen findings plus an error alert."""
+    cached = analysis_cache.get(cache_key) if cache_key else None
+    if cached is not None:
+        return cached
+    return local_alerts + [{"type": "🔴 ERROR", "finding": "AI analysis is temporarily unavailable; showing local pre-screen results only."}]
+
+def analyze_with_llm(patient_profile_text, drug_data, screen=None, use_cache=True):
     """
     Uses the Gemini LLM to analyze the patient profile against the drug data.
+    If a PatientScreen is given, its literal allergy/interaction hits are
+    returned first; the LLM is skipped when they are conclusive, and
+    otherwise told not to repeat them. Pre-screen hints (conditional label
+    mentions) are passed to the LLM to verify, not reported directly. Results are memoized in
+    analysis_cache unless use_cache is False; errors are never cached.
     """
+    cache_key = analysis_cache_key(patient_profile_text, drug_data) if ANALYSIS_CACHE_SIZE > 0 else None
+    if cache_key and use_cache:
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    local_alerts, hints, conclusive = screen.screen(drug_data) if screen else ([], [], False)
+    if conclusive and PRESCREEN_SKIP_LLM:
+        return local_alerts
+
+    already_found = ""
+    if local_alerts:
+        already_found = "ALREADY REPORTED (do not repeat these):\n    " + "\n    ".join(
+            f"{alert['type']}: {alert['finding']}" for alert in local_alerts
+        ) + "\n    ---"
+    if hints:
+        already_found += "\n    PRE-SCREEN HINTS (verify against the label; report only if its conditions apply to this patient):\n    " + "\n    ".join(hints) + "\n    ---"
+
+    label_context, _ = build_label_context(patient_profile_text, drug_data)
     user_prompt = f"""
     PATIENT PROFILE:
     {patient_profile_text}
 
     DRUG DATA FOR: {drug_data['genericName']}
+    (Label passages below were pre-selected for relevance to this patient.)
     ---
     CONTRAINDICATIONS:
-    {drug_data['contraindications']}
+    {label_context['contraindications']}
     ---
     WARNINGS AND PRECAUTIONS:
-    {drug_data['warnings_and_precautions']}
+    {label_context['warnings_and_precautions']}
     ---
     DRUG INTERACTIONS:
-    {drug_data['drugInteractions']}
+    {label_context['drugInteractions']}
     ---
     ADVERSE REACTIONS:
-    {drug_data['adverseReactions']}
+    {label_context['adverseReactions']}
     ---
+    {already_found}
     ANALYZE and return all conflicts. If no conflicts are found, return a single "INFO" alert.
     """
     
@@ -145,29 +424,48 @@ def analyze_with_llm(patient_profile_text, drug_data):
     delay = 1
     
     for attempt in range(max_retries):
+        if not gemini_breaker.allow():
+            return degraded_analysis(cache_key, local_alerts)
+        try:
+            gemini_limiter.acquire(LLM_QUEUE_TIMEOUT)
+        except RateLimitTimeout as e:
+            gemini_breaker.release()
+            print(f"Skipping LLM call for {drug_data['genericName']}: {e}")
+            return degraded_analysis(cache_key, local_alerts)
+
         try:
             response = model.generate_content(user_prompt)
+        except Exception as e:
+            gemini_breaker.record_failure()
+            print(f"Error calling LLM on attempt {attempt + 1}: {e}")
+            if "429" in str(e) or "503" in str(e):
+                # Pause the shared limiter so every caller backs off together.
+                print(f"Rate limit or server error. Pausing Gemini calls for {delay} seconds...")
+                gemini_limiter.pause(delay)
+                delay *= 2
+                continue
+            return local_alerts + [{"type": "🔴 ERROR", "finding": f"Could not analyze drug: {str(e)}"}]
+
+        gemini_breaker.record_success()
+        try:
             alerts = json.loads(response.text)
+            if local_alerts:
+                # The pre-screen already found something, so a bare "no conflicts" is wrong.
+                alerts = local_alerts + [alert for alert in alerts if alert.get("type") != "🟢 INFO"]
+            if cache_key and not any(alert.get("type") == "🔴 ERROR" for alert in alerts):
+                analysis_cache.set(cache_key, alerts)
             return alerts
 
         except Exception as e:
-            print(f"Error calling LLM on attempt {attempt + 1}: {e}")
-            raw_response = "No response object"
-            if "response" in locals():
-                try:
-                    raw_response = response.text
-                except Exception:
-                    raw_response = "Could not get response.text"
+            print(f"Error parsing LLM response on attempt {attempt + 1}: {e}")
+            try:
+                raw_response = response.text
+            except Exception:
+                raw_response = "Could not get response.text"
             print(f"LLM Response (raw): {raw_response}")
-            
-            if "429" in str(e) or "503" in str(e):
-                print(f"Rate limit or server error. Retrying in {delay} seconds...")
-                time.sleep(delay)
-                delay *= 2
-            else:
-                return [{"type": "🔴 ERROR", "finding": f"Could not analyze drug: {str(e)}"}]
+            return local_alerts + [{"type": "🔴 ERROR", "finding": f"Could not analyze drug: {str(e)}"}]
 
-    return [{"type": "🔴 ERROR", "finding": "Could not analyze drug after multiple retries."}]
+    return local_alerts + [{"type": "🔴 ERROR", "finding": "Could not analyze drug after multiple retries."}]
 
 def get_profile_text(profile):
     """Helper function to convert patient profile JSON to text for the LLM."""
@@ -178,6 +476,39 @@ def get_profile_text(profile):
     - Other Medications: {', '.join(profile.get('meds', [])) or 'N/A'}
     """
 
+def build_drug_report(profile_text, drug_def, drug_data, screen=None, use_cache=True):
+    """Runs the analysis for one drug whose label was already fetched. Never
+    raises, so one failing drug cannot take down the rest of the report."""
+    drug_name = drug_def["name"]
+    try:
+        if not drug_data:
+            return {
+                "genericName": drug_name,
+                "brandName": "N/A",
+                "drugClass": drug_def["class"],
+                "alerts": [{"type": "🔴 ERROR", "finding": "Could not fetch drug data from openFDA."}],
+                "fullData": {}
+            }
+
+        alerts = analyze_with_llm(profile_text, drug_data, screen, use_cache)
+
+        return {
+            "genericName": drug_data["genericName"],
+            "brandName": drug_data["brandName"],
+            "drugClass": drug_def["class"],
+            "alerts": alerts,
+            "fullData": drug_data
+        }
+    except Exception as e:
+        print(f"Error building report for {drug_name}: {e}")
+        return {
+            "genericName": drug_name,
+            "brandName": "N/A",
+            "drugClass": drug_def["class"],
+            "alerts": [{"type": "🔴 ERROR", "finding": f"Could not analyze drug: {str(e)}"}],
+            "fullData": {}
+        }
+
 # --- API Endpoints ---
 
 @app.route('/generate-report', methods=['POST'])
@@ -189,40 +520,80 @@ def generate_report():
             return jsonify({"error": "No patient profile provided"}), 400
             
         profile_text = get_profile_text(profile)
-        all_reports = []
+        screen = PatientScreen(profile)
+        use_cache = not wants_cache_bypass()
+        shape = report_shaper()
 
-        for drug_def in COMMON_BP_DRUGS:
-            drug_name = drug_def["name"]
-            drug_data = fetch_drug_data(drug_name)
-            
-            if not drug_data:
-                report = {
-                    "genericName": drug_name,
-                    "brandName": "N/A",
-                    "drugClass": drug_def["class"],
-                    "alerts": [{"type": "🔴 ERROR", "finding": "Could not fetch drug data from openFDA."}],
-                    "fullData": {}
-                }
-                all_reports.append(report)
-                continue
-            
-            alerts = analyze_with_llm(profile_text, drug_data)
-            
-            report = {
-                "genericName": drug_data["genericName"],
-                "brandName": drug_data["brandName"],
-                "drugClass": drug_def["class"],
-                "alerts": alerts,
-                "fullData": drug_data
-            }
-            all_reports.append(report)
+        # One openFDA round trip for every label, then the per-drug analyses
+        # run concurrently; map() keeps COMMON_BP_DRUGS order.
+        labels = fetch_drug_data_batch([drug_def["name"] for drug_def in COMMON_BP_DRUGS])
+        with ThreadPoolExecutor(max_workers=min(REPORT_CONCURRENCY, len(COMMON_BP_DRUGS))) as executor:
+            all_reports = list(executor.map(
+                lambda drug_def: build_drug_report(profile_text, drug_def, labels.get(drug_def["name"]), screen, use_cache),
+                COMMON_BP_DRUGS
+            ))
 
-        return jsonify(all_reports)
+        return jsonify([shape(report, drug_def["name"]) for report, drug_def in zip(all_reports, COMMON_BP_DRUGS)])
 
     except Exception as e:
         print(f"An error occurred in /generate-report: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/generate-report/stream', methods=['POST'])
+def generate_report_stream():
+    """
+    Streaming /generate-report: each drug's report (same shape as the
+    non-streaming endpoint) is sent as soon as its analysis finishes, then
+    a final summary. NDJSON by default; Server-Sent Events with
+    ?format=sse or Accept: text/event-stream.
+    """
+    profile = request.json
+    if not profile:
+        return jsonify({"error": "No patient profile provided"}), 400
+
+    started = time.time()
+    profile_text = get_profile_text(profile)
+    screen = PatientScreen(profile)
+    use_cache = not wants_cache_bypass()
+    shape = report_shaper()
+    use_sse = request.args.get("format") == "sse" or "text/event-stream" in request.headers.get("Accept", "")
+
+    def encode(event, index, payload):
+        if use_sse:
+            event_id = f"id: {index}\n" if index is not None else ""
+            return f"event: {event}\n{event_id}data: {json.dumps(payload)}\n\n"
+        if event == "summary":
+            return json.dumps({"summary": payload}) + "\n"
+        return json.dumps({"index": index, "report": payload}) + "\n"
+
+    def generate():
+        labels = fetch_drug_data_batch([drug_def["name"] for drug_def in COMMON_BP_DRUGS])
+        errors = 0
+        first_report_ms = None
+        with ThreadPoolExecutor(max_workers=min(REPORT_CONCURRENCY, len(COMMON_BP_DRUGS))) as executor:
+            futures = {
+                executor.submit(build_drug_report, profile_text, drug_def, labels.get(drug_def["name"]), screen, use_cache): index
+                for index, drug_def in enumerate(COMMON_BP_DRUGS)
+            }
+            for future in as_completed(futures):
+                report = future.result()
+                errors += any(alert.get("type") == "🔴 ERROR" for alert in report["alerts"])
+                if first_report_ms is None:
+                    first_report_ms = round((time.time() - started) * 1000)
+                index = futures[future]
+                yield encode("report", index, shape(report, COMMON_BP_DRUGS[index]["name"]))
+
+        yield encode("summary", None, {
+            "drugs": len(COMMON_BP_DRUGS),
+            "errors": errors,
+            "firstReportMs": first_report_ms,
+            "totalMs": round((time.time() - started) * 1000),
+        })
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    mimetype = "text/event-stream" if use_sse else "application/x-ndjson"
+    return Response(generate(), mimetype=mimetype, headers=headers)
+
 @app.route('/check-drug', methods=['POST'])
 def check_single_drug():
     """Checks a single, custom drug name against the patient profile."""
@@ -246,8 +617,8 @@ def check_single_drug():
                 "fullData": {}
             })
         
-        # 2. Analyze with LLM
-        alerts = analyze_with_llm(profile_text, drug_data)
+        # 2. Pre-screen locally, then analyze with LLM
+        alerts = analyze_with_llm(profile_text, drug_data, PatientScreen(profile), not wants_cache_bypass())
         
         # 3. Build and return report
         report = {
@@ -257,14 +628,64 @@ def check_single_drug():
             "alerts": alerts,
             "fullData": drug_data
         }
-        return jsonify(report)
+        return jsonify(report_shaper()(report, drug_name))
 
     except Exception as e:
         print(f"An error occurred in /check-drug: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/label/<path:drug_name>', methods=['GET'])
+def get_label(drug_name):
+    """Full label sections for one drug (what ?compact=1 reports leave out).
+    ?section=contraindications returns just that section."""
+    drug_data = fetch_drug_data(drug_name)
+    if not drug_data:
+        return jsonify({"error": f"Could not fetch drug data for '{drug_name}'."}), 404
+
+    section = request.args.get("section")
+    if section:
+        if section not in LABEL_SECTION_KEYS:
+            return jsonify({"error": f"Unknown section '{section}'. Use one of: {', '.join(LABEL_SECTION_KEYS)}"}), 400
+        drug_data = {
+            "genericName": drug_data["genericName"],
+            "labelVersion": drug_data.get("labelVersion"),
+            section: drug_data[section]
+        }
+    response = jsonify(drug_data)
+    # Labels change rarely; let clients reuse them and revalidate with the ETag.
+    response.headers["Cache-Control"] = "public, max-age=3600"
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for the Gemini rate limiter and circuit breaker."""
+    return Response(render_metrics(gemini_limiter, gemini_breaker), mimetype="text/plain; version=0.0.4")
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Label and analysis cache statistics, and tokens saved by label pre-filtering."""
+    with label_context_lock:
+        context_stats = dict(label_context_stats, tokenBudget=LABEL_CONTEXT_TOKENS)
+    return jsonify({
+        "labels": {
+            "memory": label_memory_cache.stats(),
+            "disk": {"path": LABEL_CACHE_PATH, "entries": label_store.count()} if label_store else None,
+            "source": LABEL_SOURCE,
+            "snapshot": label_snapshot.stats() if label_snapshot else None,
+        },
+        "labelContext": context_stats,
+        "analysis": analysis_cache.stats(),
+        "gemini": {"limiter": gemini_limiter.stats(), "breaker": gemini_breaker.stats()}
+    })
+
 # --- Run the App ---
 if __name__ == '__main__':
+    if "--prewarm" in sys.argv:
+        # One-off: python app.py --prewarm
+        prewarm_label_cache()
+        sys.exit(0)
+
+    threading.Thread(target=prewarm_label_cache, name="label-prewarm", daemon=True).start()
     print("Starting Flask server...")
     print("Your backend is running at http://127.0.0.1:5000")
     print("Open the index.html file in your browser to use the app.")
@@ -0,0 +1,116 @@
+"""
+Caching helpers for the Clinical Summary backend.
+
+- TTLCache: thread-safe, bounded in-memory LRU with per-entry expiry and
+  hit/miss counters.
+- LabelStore: on-disk SQLite store of parsed openFDA label dicts, so labels
+  survive restarts and are shared by every worker on the machine.
+- fingerprint: stable hash used to key cached analyses.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_drug_name(drug_name):
+    """Cache key for a drug: lower-cased with whitespace collapsed."""
+    return " ".join((drug_name or "").lower().split())
+
+
+def fingerprint(value):
+    """sha256 of a JSON-serializable value, independent of key order."""
+    canonical = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire `ttl` seconds after being stored."""
+
+    def __init__(self, maxsize=256, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttlSeconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class LabelStore:
+    """SQLite table of parsed labels keyed on the normalized drug name."""
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS labels (
+                   name TEXT PRIMARY KEY,
+                   label_version TEXT,
+                   fetched_at REAL,
+                   data TEXT
+               )"""
+        )
+        self._db.commit()
+
+    def get(self, name):
+        """Returns (drug_data, label_version, fetched_at) or None if missing or expired."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, label_version, fetched_at FROM labels WHERE name = ?", (name,)
+            ).fetchone()
+        if not row or time.time() - row[2] > self.ttl:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def put(self, name, drug_data, label_version):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO labels (name, label_version, fetched_at, data) VALUES (?, ?, ?, ?)",
+                (name, label_version, time.time(), json.dumps(drug_data)),
+            )
+            self._db.commit()
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
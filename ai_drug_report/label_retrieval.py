@@ -0,0 +1,168 @@
+"""
+Relevance pre-filtering of openFDA label text.
+
+A drug label is split into sentences and indexed with BM25 (a small
+inverted index, no external dependencies). The patient profile text is the
+query, expanded with the class names labels use for the patient's drugs
+("ibuprofen" also asks for "nsaids", "nonsteroidal anti-inflammatory").
+Contraindications are pinned so the "do not use" list is always sent
+first, then the best-scoring sentences; any budget left is filled with the
+remaining sentences, a section at a time, so no section is left empty while
+there is room. Everything is sent in label order.
+"""
+
+import math
+import re
+from collections import Counter, defaultdict, deque
+
+from prescreen import SYNONYMS
+
+# Label keys produced by parse_label, with the heading used in the prompt.
+LABEL_SECTIONS = [
+    ("contraindications", "CONTRAINDICATIONS"),
+    ("warnings_and_precautions", "WARNINGS AND PRECAUTIONS"),
+    ("drugInteractions", "DRUG INTERACTIONS"),
+    ("adverseReactions", "ADVERSE REACTIONS"),
+]
+PINNED_SECTIONS = {"contraindications"}
+NO_INFORMATION = "No information listed."
+NOTHING_RELEVANT = "No passages matched this patient's profile."
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Filler words, plus the field labels get_profile_text writes into the query.
+STOPWORDS = set("""
+a an and are as at be been by can could did do does for from had has have if in into is it its
+may might more most must no not of on or other should such than that the their then there these
+this those to was were when which while who will with within without you your patient patients
+vitals notes history allergies medications n/a na none
+""".split())
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.;!?])\s+|\s+(?=\(?\d+(?:\.\d+)+\)?\s)")
+_WORD = re.compile(r"[a-z][a-z0-9\-]+")
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def stem(word):
+    """Very light suffix stripping so 'reactions' matches 'reaction'."""
+    for suffix in ("ing", "es", "ed", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text):
+    return [stem(word) for word in _WORD.findall((text or "").lower()) if word not in STOPWORDS]
+
+
+def expand_query(text):
+    """Adds the label wording for any drug or class named in the query (see prescreen.SYNONYMS)."""
+    lowered = (text or "").lower()
+    extra = [
+        " ".join(synonyms) for term, synonyms in SYNONYMS.items()
+        if re.search(r"(?<![a-z0-9])" + re.escape(term) + r"(?![a-z0-9])", lowered)
+    ]
+    return " ".join([text or ""] + extra)
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text or "") if len(s.strip()) > 2]
+
+
+class LabelIndex:
+    """BM25 index over the sentences of one parsed label."""
+
+    def __init__(self, drug_data):
+        self.sentences = []  # (section_key, position, text, token_estimate)
+        self.full_tokens = 0
+        postings = defaultdict(list)
+        lengths = []
+        for section_key, _ in LABEL_SECTIONS:
+            text = drug_data.get(section_key) or NO_INFORMATION
+            self.full_tokens += estimate_tokens(text)
+            for sentence in split_sentences(text):
+                sentence_id = len(self.sentences)
+                terms = Counter(tokenize(sentence))
+                for term, freq in terms.items():
+                    postings[term].append((sentence_id, freq))
+                lengths.append(sum(terms.values()))
+                self.sentences.append((section_key, sentence_id, sentence, estimate_tokens(sentence) + 1))
+        self.postings = dict(postings)
+        self.lengths = lengths
+        self.avg_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    def score(self, query_terms):
+        """BM25 score for every sentence that shares a term with the query."""
+        scores = defaultdict(float)
+        total = len(self.sentences)
+        for term in set(query_terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for sentence_id, freq in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[sentence_id] / self.avg_length)
+                scores[sentence_id] += idf * freq * (BM25_K1 + 1) / (freq + norm)
+        return scores
+
+    def select(self, query_text, token_budget):
+        """
+        Returns ({section_key: text}, stats). Pinned sections go in first, then
+        the best-scoring sentences, then unscored sentences taken from each
+        section in turn until the budget is spent. A label that already fits
+        the budget is returned whole.
+        """
+        if token_budget <= 0 or self.full_tokens <= token_budget:
+            chosen = set(range(len(self.sentences)))
+        else:
+            chosen = set()
+            used = 0
+            pinned = [s for s in self.sentences if s[0] in PINNED_SECTIONS]
+            scores = self.score(tokenize(expand_query(query_text)))
+            ranked = sorted(scores, key=lambda sentence_id: (-scores[sentence_id], sentence_id))
+            for section_key, sentence_id, _, tokens in pinned + [self.sentences[i] for i in ranked]:
+                if sentence_id in chosen or used + tokens > token_budget:
+                    continue
+                chosen.add(sentence_id)
+                used += tokens
+
+            # Round-robin over sections, in label order within each, so one
+            # long section cannot take all of the leftover budget.
+            queues = [
+                deque(s for s in self.sentences if s[0] == section_key and s[1] not in chosen)
+                for section_key, _ in LABEL_SECTIONS
+            ]
+            while any(queues):
+                for queue in queues:
+                    if not queue:
+                        continue
+                    _, sentence_id, _, tokens = queue.popleft()
+                    if used + tokens <= token_budget:
+                        chosen.add(sentence_id)
+                        used += tokens
+
+        sections = {}
+        sent_tokens = 0
+        for section_key, _ in LABEL_SECTIONS:
+            picked = [s[2] for s in self.sentences if s[0] == section_key and s[1] in chosen]
+            if picked:
+                sections[section_key] = " ".join(picked)
+            elif len(chosen) == len(self.sentences):
+                sections[section_key] = NO_INFORMATION
+            else:
+                sections[section_key] = NOTHING_RELEVANT
+            sent_tokens += estimate_tokens(sections[section_key])
+
+        stats = {
+            "labelTokens": self.full_tokens,
+            "promptTokens": sent_tokens,
+            "tokensSaved": max(0, self.full_tokens - sent_tokens),
+            "sentencesKept": len(chosen),
+            "sentencesTotal": len(self.sentences),
+        }
+        return sections, stats
@@ -0,0 +1,207 @@
+"""
+Offline openFDA label snapshot.
+
+Imports the openFDA drug-label bulk download (drug-label-*.json or .json.zip
+from https://open.fda.gov/data/downloads/) into one compact file that the
+server memory-maps, so every worker shares a single copy in the page cache
+and a lookup is one hash probe plus one record read.
+
+Only the fields the app uses are kept (openfda names, the four label
+sections, effective_time, version). Names are matched exactly, as the api
+path does with generic_name.exact / brand_name.exact: each generic and
+brand name is indexed. Single-ingredient labels also get the first word of
+their generic name as a fallback alias ("losartan" for "LOSARTAN
+POTASSIUM") when no label uses it as a full name. When several labels
+share a name, single-ingredient labels beat combinations, then the most
+recent one wins.
+
+File layout (little-endian):
+    header   MAGIC, slot_count u32, record_count u32, key_count u32
+    slots    slot_count x (hash u64, offset u64, length u32, unused u32)
+    records  zlib-compressed JSON: {"names": [...], "label": {...}}
+
+Usage:
+    python label_snapshot.py import drug-label-0001-of-0013.json.zip ... --out label_snapshot.bin
+    python label_snapshot.py lookup label_snapshot.bin lisinopril
+"""
+
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+import sys
+import zipfile
+import zlib
+
+from label_cache import normalize_drug_name
+
+MAGIC = b"LBLSNAP1"
+HEADER = struct.Struct("<8sIII")
+SLOT = struct.Struct("<QQII")
+KEPT_SECTIONS = ("contraindications", "warnings_and_precautions", "drug_interactions", "adverse_reactions")
+INDEXED_NAMES = ("generic_name", "brand_name")
+
+
+def name_hash(key):
+    value = struct.unpack("<Q", hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest())[0]
+    return value or 1  # 0 marks an empty slot
+
+
+def compact_label(drug):
+    """The subset of an openFDA label record that parse_label reads."""
+    openfda = drug.get("openfda", {})
+    label = {key: drug[key] for key in KEPT_SECTIONS if drug.get(key)}
+    label["openfda"] = {key: openfda[key] for key in ("generic_name", "brand_name") if openfda.get(key)}
+    label["effective_time"] = drug.get("effective_time", "unknown")
+    label["version"] = drug.get("version", "?")
+    return label
+
+
+def label_names(drug):
+    openfda = drug.get("openfda", {})
+    names = {normalize_drug_name(name) for field in INDEXED_NAMES for name in openfda.get(field, [])}
+    names.discard("")
+    return sorted(names)
+
+
+def is_single_ingredient(drug):
+    openfda = drug.get("openfda", {})
+    generics = [normalize_drug_name(name) for name in openfda.get("generic_name", [])]
+    if len(openfda.get("substance_name", [])) > 1:
+        return False
+    return not any(" and " in name or "," in name or "/" in name for name in generics)
+
+
+def label_aliases(drug, names):
+    """First word of a single-ingredient generic name, e.g. the active moiety of a salt."""
+    if not is_single_ingredient(drug):
+        return []
+    generics = {normalize_drug_name(name) for name in drug.get("openfda", {}).get("generic_name", [])}
+    return sorted({name.split()[0] for name in generics if " " in name} - set(names))
+
+
+def iter_bulk_labels(path):
+    """Yields label records from a bulk .json file or a .zip holding them."""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.namelist():
+                if member.endswith(".json"):
+                    with archive.open(member) as handle:
+                        yield from json.load(handle).get("results", [])
+    else:
+        with open(path, encoding="utf-8") as handle:
+            yield from json.load(handle).get("results", [])
+
+
+def build_snapshot(input_paths, out_path):
+    """Writes the snapshot file. Returns (records, keys)."""
+    # Best label per name (single-ingredient first, then newest); only labels
+    # that win at least one name are written.
+    # Records are compressed as they are read so the whole bulk set fits in memory.
+    best = {}
+    alias_best = {}
+    labels = []
+    for path in input_paths:
+        for drug in iter_bulk_labels(path):
+            names = label_names(drug)
+            if not names:
+                continue
+            index = len(labels)
+            aliases = label_aliases(drug, names)
+            record = {"names": names + aliases, "label": compact_label(drug)}
+            blob = zlib.compress(json.dumps(record, separators=(",", ":")).encode("utf-8"), 6)
+            labels.append(((is_single_ingredient(drug), drug.get("effective_time", "")), blob))
+            for table, keys in ((best, names), (alias_best, aliases)):
+                for name in keys:
+                    current = table.get(name)
+                    if current is None or labels[current][0] < labels[index][0]:
+                        table[name] = index
+
+    for alias, index in alias_best.items():
+        best.setdefault(alias, index)
+
+    kept = sorted(set(best.values()))
+    slot_count = max(8, 1 << (len(best) * 2 - 1).bit_length())  # load factor <= 0.5
+    data_start = HEADER.size + slot_count * SLOT.size
+    slots = [None] * slot_count
+    locations = {}
+
+    with open(out_path, "wb") as out:
+        out.seek(data_start)
+        for index in kept:
+            blob = labels[index][1]
+            locations[index] = (out.tell(), len(blob))
+            out.write(blob)
+
+        for name, index in best.items():
+            hashed = name_hash(name)
+            slot = hashed % slot_count
+            while slots[slot] is not None:
+                slot = (slot + 1) % slot_count
+            slots[slot] = (hashed,) + locations[index]
+
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, slot_count, len(kept), len(best)))
+        for entry in slots:
+            out.write(SLOT.pack(*(entry or (0, 0, 0)), 0))
+    return len(kept), len(best)
+
+
+class LabelSnapshot:
+    """Read-only, memory-mapped view of a snapshot file. Safe to share across threads."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.slot_count, self.record_count, self.key_count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a label snapshot")
+
+    def get(self, name):
+        """Compact openFDA label dict for a generic/brand name, or None."""
+        key = normalize_drug_name(name)
+        hashed = name_hash(key)
+        slot = hashed % self.slot_count
+        for _ in range(self.slot_count):
+            slot_hash, offset, length, _ = SLOT.unpack_from(self._map, HEADER.size + slot * SLOT.size)
+            if slot_hash == 0:
+                return None
+            if slot_hash == hashed:
+                record = json.loads(zlib.decompress(self._map[offset:offset + length]))
+                if key in record["names"]:
+                    return record["label"]
+            slot = (slot + 1) % self.slot_count
+        return None
+
+    def stats(self):
+        return {"path": self.path, "labels": self.record_count, "names": self.key_count, "bytes": len(self._map)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query an offline openFDA label snapshot.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("import", help="ingest openFDA drug-label bulk files")
+    build.add_argument("inputs", nargs="+", help="drug-label-*.json or .json.zip files")
+    build.add_argument("--out", default="label_snapshot.bin")
+    lookup = commands.add_parser("lookup", help="print the label stored for a drug name")
+    lookup.add_argument("snapshot")
+    lookup.add_argument("name")
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        records, keys = build_snapshot(args.inputs, args.out)
+        print(f"Wrote {args.out}: {records} labels, {keys} names.")
+        return 0
+
+    label = LabelSnapshot(args.snapshot).get(args.name)
+    if label is None:
+        print(f"No label for '{args.name}'.")
+        return 1
+    print(json.dumps(label, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Process-wide guards for Gemini calls.
+
+- TokenBucket: one shared limiter sized to the Gemini quota. Callers reserve
+  a slot and wait their turn, so threads queue in order instead of each
+  sleeping and retrying on its own schedule. A 429 pauses the whole bucket.
+- CircuitBreaker: after repeated upstream failures, calls fail fast for a
+  cool-down period, then a single trial call decides whether to close again.
+- render_metrics: queue wait and breaker state in Prometheus text format.
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a caller would have to queue longer than it is allowed to."""
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.waits = deque(maxlen=1024)
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.timeouts = 0
+        self.waiting = 0
+
+    def _refill(self, now):
+        start = max(self._updated, self._paused_until)
+        if now > start:
+            self._tokens = min(self.capacity, self._tokens + (now - start) * self.rate)
+        self._updated = max(now, self._updated)
+
+    def acquire(self, max_wait):
+        """Reserves one call and sleeps until it is due. Returns the seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Taking the token now (possibly going negative) reserves our place in line.
+            self._tokens -= 1
+            ready_at = max(now, self._paused_until)
+            if self._tokens < 0:
+                ready_at += -self._tokens / self.rate
+            wait = ready_at - now
+            if wait > max_wait:
+                self._tokens += 1
+                self.timeouts += 1
+                raise RateLimitTimeout(f"Gemini rate limit queue is {wait:.1f}s long")
+            self.waiting += 1
+
+        try:
+            if wait > 0:
+                time.sleep(wait)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                self.waits.append(wait)
+                self.wait_count += 1
+                self.wait_total += wait
+        return wait
+
+    def pause(self, seconds):
+        """Stops handing out tokens for `seconds` (e.g. after a 429) for every caller."""
+        with self._lock:
+            now = time.monotonic()
+            # Bank what was earned before the pause; _refill skips the paused span.
+            self._refill(now)
+            self._paused_until = max(self._paused_until, now + seconds)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self.waits)
+            return {
+                "ratePerMinute": round(self.rate * 60, 3),
+                "burst": self.capacity,
+                "waiting": self.waiting,
+                "waitCount": self.wait_count,
+                "waitSecondsTotal": round(self.wait_total, 3),
+                "waitSecondsP95": round(waits[min(len(waits) - 1, int(0.95 * len(waits)))], 3) if waits else 0.0,
+                "timeouts": self.timeouts,
+            }
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go upstream now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """Gives back a half-open trial slot when the call never went upstream."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutiveFailures": self.failures,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+def render_metrics(bucket, breaker):
+    limiter = bucket.stats()
+    circuit = breaker.stats()
+    states = (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN)
+    lines = [
+        "# HELP gemini_limiter_wait_seconds Time Gemini calls spent queued for the rate limiter.",
+        "# TYPE gemini_limiter_wait_seconds summary",
+        f'gemini_limiter_wait_seconds{{quantile="0.95"}} {limiter["waitSecondsP95"]}',
+        f"gemini_limiter_wait_seconds_sum {limiter['waitSecondsTotal']}",
+        f"gemini_limiter_wait_seconds_count {limiter['waitCount']}",
+        "# HELP gemini_limiter_waiting Gemini calls currently queued.",
+        "# TYPE gemini_limiter_waiting gauge",
+        f"gemini_limiter_waiting {limiter['waiting']}",
+        "# HELP gemini_limiter_timeouts_total Calls rejected because the queue was too long.",
+        "# TYPE gemini_limiter_timeouts_total counter",
+        f"gemini_limiter_timeouts_total {limiter['timeouts']}",
+        "# HELP gemini_breaker_state 1 for the circuit breaker's current state.",
+        "# TYPE gemini_breaker_state gauge",
+    ]
+    lines += [f'gemini_breaker_state{{state="{state}"}} {int(circuit["state"] == state)}' for state in states]
+    lines += [
+        "# HELP gemini_breaker_trips_total Times the breaker opened.",
+        "# TYPE gemini_breaker_trips_total counter",
+        f"gemini_breaker_trips_total {circuit['trips']}",
+        "# HELP gemini_breaker_rejected_total Calls failed fast while the breaker was open.",
+        "# TYPE gemini_breaker_rejected_total counter",
+        f"gemini_breaker_rejected_total {circuit['rejected']}",
+    ]
+    return "\n".join(lines) + "\n"
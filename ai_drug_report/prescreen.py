@@ -0,0 +1,156 @@
+"""
+Deterministic allergy / interaction pre-screen.
+
+Builds one Aho-Corasick automaton from a patient's allergies and other
+medications (plus a few well-known synonyms) and scans every label section
+in a single pass. Hits on the drug's own names and its interaction list
+become alerts in the same schema Gemini returns, so they can be shown
+immediately and the LLM call can be skipped or narrowed; hits in the
+contraindications are conditional and go to the LLM as hints.
+"""
+
+from collections import deque
+
+# Common allergy/drug-class names and the wording labels use for them.
+SYNONYMS = {
+    "sulfa": ["sulfonamide", "sulfonamides", "sulfonamide-derived"],
+    "sulfonamide": ["sulfa", "sulfonamide-derived"],
+    "ace inhibitor": ["ace inhibitors", "angiotensin-converting enzyme inhibitor", "angiotensin converting enzyme"],
+    "arb": ["angiotensin receptor blocker", "angiotensin ii receptor"],
+    "nsaid": ["nsaids", "nonsteroidal anti-inflammatory", "non-steroidal anti-inflammatory"],
+    "ibuprofen": ["nsaids", "nonsteroidal anti-inflammatory", "non-steroidal anti-inflammatory"],
+    "naproxen": ["nsaids", "nonsteroidal anti-inflammatory", "non-steroidal anti-inflammatory"],
+    "diclofenac": ["nsaids", "nonsteroidal anti-inflammatory", "non-steroidal anti-inflammatory"],
+    "aspirin": ["salicylate", "salicylates", "nsaids"],
+    "celecoxib": ["cox-2 inhibitors", "nsaids"],
+    "potassium": ["potassium supplements", "potassium-containing salt substitutes"],
+    "spironolactone": ["potassium-sparing diuretics", "aldosterone antagonist"],
+    "eplerenone": ["potassium-sparing diuretics", "aldosterone antagonist"],
+    "furosemide": ["diuretics", "loop diuretic"],
+    "hydrochlorothiazide": ["thiazide", "diuretics"],
+    "insulin": ["antidiabetic", "hypoglycemia"],
+    "metformin": ["antidiabetic", "oral hypoglycemic"],
+    "warfarin": ["anticoagulant", "anticoagulants"],
+    "digoxin": ["digitalis", "cardiac glycosides"],
+    "verapamil": ["calcium channel blockers", "non-dihydropyridine"],
+    "diltiazem": ["calcium channel blockers", "non-dihydropyridine"],
+    "sildenafil": ["pde-5 inhibitors", "phosphodiesterase"],
+}
+
+# Profile entries too vague to match on.
+IGNORED_TERMS = {"", "n/a", "na", "none", "nil", "nkda", "no known allergies"}
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: every pattern is found in one pass over the text."""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add(self, pattern, value):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = next_state
+        self._out[state].append((pattern, value))
+
+    def build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._out[next_state] = self._out[next_state] + self._out[self._fail[next_state]]
+        return self
+
+    def search(self, text):
+        """Yields (start, pattern, value) for every whole-word match in `text`."""
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern, value in self._out[state]:
+                start = end - len(pattern) + 1
+                before = text[start - 1] if start > 0 else " "
+                after = text[end + 1] if end + 1 < len(text) else " "
+                if not before.isalnum() and not after.isalnum():
+                    yield start, pattern, value
+
+
+def _terms_for(entry):
+    term = " ".join(str(entry).lower().split())
+    if term in IGNORED_TERMS or len(term) < 3:
+        return []
+    return [term] + SYNONYMS.get(term, [])
+
+
+class PatientScreen:
+    """Automaton for one patient's allergies and medications; reusable across drugs."""
+
+    def __init__(self, profile):
+        self.automaton = AhoCorasick()
+        self.size = 0
+        for kind in ("allergies", "meds"):
+            for entry in profile.get(kind) or []:
+                for term in _terms_for(entry):
+                    self.automaton.add(term, (kind, str(entry).strip()))
+                    self.size += 1
+        self.automaton.build()
+
+    def screen(self, drug_data):
+        """
+        Returns (alerts, hints, conclusive). Alerts are literal findings;
+        hints are matches whose relevance depends on conditions only the LLM
+        can judge. Conclusive means an allergy matched the drug's own generic
+        or brand name.
+        """
+        if not self.size:
+            return [], [], False
+
+        alerts = []
+        hints = []
+        seen = set()
+
+        def add(alert_type, key, finding):
+            if key not in seen:
+                seen.add(key)
+                alerts.append({"type": alert_type, "finding": finding})
+
+        drug_names = f" {drug_data.get('genericName', '')}, {drug_data.get('brandName', '')} ".lower()
+        for _, term, (kind, entry) in self.automaton.search(drug_names):
+            if kind == "allergies":
+                add("🔴 CONTRAINDICATION", ("allergy", entry),
+                    f"Patient has a listed allergy to '{entry}', which matches {drug_data.get('genericName')} itself.")
+
+        for _, term, (kind, entry) in self.automaton.search(drug_data.get("contraindications") or ""):
+            # Label clauses are often conditional ("do not co-administer aliskiren
+            # in patients with diabetes"), so these hits are only hints for Gemini.
+            key = ("allergy", entry) if kind == "allergies" else ("med", entry)
+            if key in seen:
+                continue
+            seen.add(key)
+            if kind == "allergies":
+                hints.append(f"Patient is allergic to '{entry}', and the label's contraindications mention '{term}'.")
+            else:
+                hints.append(f"Patient takes '{entry}', and the label's contraindications mention '{term}'.")
+
+        for _, term, (kind, entry) in self.automaton.search(drug_data.get("drugInteractions") or ""):
+            if kind == "meds":
+                add("🟡 INTERACTION", ("interaction", entry),
+                    f"Patient takes '{entry}', and the label lists an interaction with '{term}'.")
+
+        conclusive = any(alert["type"] == "🔴 CONTRAINDICATION" for alert in alerts)
+        return alerts, hints, conclusive
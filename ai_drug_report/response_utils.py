@@ -0,0 +1,87 @@
+"""
+Response shaping for the Clinical Summary backend.
+
+- shape_report: compact / field-selected report objects, so clients that
+  collapse the label text do not have to download it.
+- finalize_response: weak ETag + If-None-Match handling for GET, then gzip
+  (or brotli, when the optional `brotli` package is installed) depending on
+  the client's Accept-Encoding.
+"""
+
+import gzip
+import hashlib
+from urllib.parse import quote
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli
+    brotli = None
+
+LABEL_SECTION_KEYS = ("contraindications", "warnings_and_precautions", "drugInteractions", "adverseReactions")
+COMPRESSIBLE_TYPES = ("application/json", "text/plain", "text/html")
+MIN_COMPRESS_BYTES = 512
+
+
+def truncate(text, limit):
+    if not isinstance(text, str) or len(text) <= limit:
+        return text
+    return text[:limit].rstrip() + "…"
+
+
+def shape_report(report, drug_name, compact=False, fields=None, preview_chars=300):
+    """
+    compact: label sections in fullData are cut to `preview_chars` and a
+    labelUrl points at the full text. The URL uses the name the report was
+    requested with (what /label resolves), not the label's genericName,
+    which can list several ingredients. fields: keep only these top-level keys.
+    """
+    if compact and report.get("fullData"):
+        full_data = dict(report["fullData"])
+        for key in LABEL_SECTION_KEYS:
+            if key in full_data:
+                full_data[key] = truncate(full_data[key], preview_chars)
+        report = dict(report, fullData=full_data, labelUrl=f"/label/{quote(drug_name)}")
+    if fields:
+        report = {key: value for key, value in report.items() if key in fields}
+    return report
+
+
+def parse_fields(value):
+    """'genericName, alerts' -> {'genericName', 'alerts'}; empty -> None."""
+    fields = {field.strip() for field in (value or "").split(",") if field.strip()}
+    return fields or None
+
+
+def _accepts(accept_encoding, coding):
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") != "q=0"
+    return False
+
+
+def finalize_response(response, method, if_none_match, accept_encoding):
+    """Adds a weak ETag (304 for a matching conditional GET) and compresses the body."""
+    if response.direct_passthrough or response.is_streamed or response.status_code != 200:
+        return response
+    if response.mimetype not in COMPRESSIBLE_TYPES:
+        return response
+
+    body = response.get_data()
+    etag = 'W/"' + hashlib.sha1(body).hexdigest() + '"'
+    response.headers["ETag"] = etag
+    if method == "GET" and if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        response.status_code = 304
+        response.set_data(b"")
+        return response
+
+    response.vary.add("Accept-Encoding")
+    if len(body) < MIN_COMPRESS_BYTES or "Content-Encoding" in response.headers:
+        return response
+    if brotli is not None and _accepts(accept_encoding, "br"):
+        response.set_data(brotli.compress(body, quality=5))
+        response.headers["Content-Encoding"] = "br"
+    elif _accepts(accept_encoding, "gzip"):
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
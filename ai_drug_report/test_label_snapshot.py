@@ -0,0 +1,39 @@
+"""Runs the snapshot importer on fixtures/drug-label-sample.json."""
+
+import os
+
+from label_snapshot import LabelSnapshot, build_snapshot
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "drug-label-sample.json")
+
+
+def build(tmp_path):
+    out = str(tmp_path / "labels.bin")
+    build_snapshot([FIXTURE], out)
+    return LabelSnapshot(out)
+
+
+def generic(label):
+    return label["openfda"]["generic_name"][0]
+
+
+def test_newest_label_wins_for_exact_names(tmp_path):
+    snapshot = build(tmp_path)
+    assert snapshot.get("Zestril")["effective_time"] == "20231102"
+    assert snapshot.get("lisinopril")["version"] == "12"
+
+
+def test_alias_comes_from_single_ingredient_label(tmp_path):
+    snapshot = build(tmp_path)
+    # The newer Lotrel combination must not take over amlodipine lookups.
+    assert generic(snapshot.get("amlodipine")) == "AMLODIPINE BESYLATE"
+    assert generic(snapshot.get("Amlodipine Besylate")) == "AMLODIPINE BESYLATE"
+    assert generic(snapshot.get("losartan")) == "LOSARTAN POTASSIUM"
+
+
+def test_combination_only_matches_its_own_names(tmp_path):
+    snapshot = build(tmp_path)
+    assert snapshot.get("lotrel")["version"] == "9"
+    assert generic(snapshot.get("amlodipine and benazepril hydrochloride")) == "AMLODIPINE AND BENAZEPRIL HYDROCHLORIDE"
+    assert snapshot.get("benazepril") is None
+    assert snapshot.get("metoprolol") is None
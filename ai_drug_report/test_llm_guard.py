@@ -0,0 +1,41 @@
+"""TokenBucket timing, driven by a fake monotonic clock."""
+
+import llm_guard
+from llm_guard import TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def bucket_with_clock(monkeypatch, rate_per_minute, burst):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_guard.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(llm_guard.time, "sleep", clock.sleep)
+    return TokenBucket(rate_per_minute, burst), clock
+
+
+def test_tokens_earned_before_a_pause_are_kept(monkeypatch):
+    bucket, clock = bucket_with_clock(monkeypatch, rate_per_minute=60, burst=2)
+    assert bucket.acquire(max_wait=10) == 0
+    assert bucket.acquire(max_wait=10) == 0
+    clock.now = 1.0  # one token earned
+    bucket.pause(1.5)
+    clock.now = 2.5  # nothing earned while paused
+    assert bucket.acquire(max_wait=10) == 0
+    assert bucket.acquire(max_wait=10) == 1.0
+
+
+def test_pause_delays_an_empty_bucket(monkeypatch):
+    bucket, clock = bucket_with_clock(monkeypatch, rate_per_minute=60, burst=1)
+    bucket.acquire(max_wait=10)
+    bucket.pause(1.5)
+    assert bucket.acquire(max_wait=10) == 2.5
+    assert clock.now == 2.5
@@ -157,35 +157,79 @@
 #     app.run(debug=True, port=5000)
 
 
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import os
-import google.generativeai as genai
-from flask import Flask, request, jsonify, send_from_directory
+import json
+import threading
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS  # ← ADDED
 from dotenv import load_dotenv
 
+from bulk_triage import normalize_patient, parse_patients
+from med_classifier import classify_locally, is_no_medication
+from metrics import LLM_FAILURES, StageTimer, record_llm_call, record_result, render_metrics
+from rule_engine import RulesWatcher, estimate_tokens
+from scenario_cache import ScenarioCache, recommendation_key
+from stub_model import StubGenerativeModel
+
 # --- Configuration ---
 load_dotenv()
 app = Flask(__name__)
 CORS(app, origins=["http://localhost:3000", "http://127.0.0.1:3000"])  # ← ADDED
 
+# "gemini" (default) or "stub" for offline load testing (see stub_model.py).
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+MODEL_NAME = "gemini-2.5-flash-preview-09-2025"
+
 api_key = os.getenv("GEMINI_API_KEY")
-if not api_key:
+if LLM_BACKEND != "stub" and not api_key:
     raise ValueError("❌ GEMINI_API_KEY not found in .env file. Please add it.")
 
-genai.configure(api_key=api_key)
-
 # --- Load Rules File ---
+# Parsed into a pre-indexed decision table (the LLM is only consulted when
+# nothing matches) and re-loaded in the background whenever the file changes.
 try:
-    with open("bp-rules.txt", "r", encoding="utf-8") as f:
-        RULES_DOCUMENT = f.read()
+    rules_watcher = RulesWatcher("bp-rules.txt", interval=float(os.getenv("RULES_RELOAD_INTERVAL", "2")))
 except FileNotFoundError:
     raise FileNotFoundError("bp-rules.txt not found in directory. Please add it.")
+rules_watcher.start()
+
+# --- Recommendation Cache ---
+recommendation_cache = ScenarioCache(
+    maxsize=int(os.getenv("RECOMMENDATION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("RECOMMENDATION_CACHE_TTL", "86400")),
+    path=os.getenv("RECOMMENDATION_CACHE_PATH") or None,
+)
+
+
+# --- Models (built lazily) ---
+# google.generativeai is slow to import and only LLM-backed requests need it,
+# so the SDK import, genai.configure and model construction are deferred to
+# the first request that calls a model, or to the optional warm-up thread.
+_genai = None
+_model_lock = threading.Lock()
+
+
+def load_genai():
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        _genai = genai
+    return _genai
+
+
+def build_model(system_instruction):
+    if LLM_BACKEND == "stub":
+        return StubGenerativeModel(MODEL_NAME, system_instruction=system_instruction)
+    return load_genai().GenerativeModel(MODEL_NAME, system_instruction=system_instruction)
 
 
 # --- Model 1: Medication Classifier ---
-classification_model = genai.GenerativeModel(
-    "gemini-2.5-flash-preview-09-2025",
-    system_instruction="""
+CLASSIFICATION_INSTRUCTION = """
 You are a medical text classifier. Your job is to read a text input and identify which of the following categories are mentioned:
 - CCB (Calcium Channel Blockers, e.g., Amlodipine, Nifedipine, Benidipine, Cilnidipine)
 - RASI (RAS Inhibitors, e.g., Telmisartan, Ramipril, Losartan, Olmesartan, Enalapril)
@@ -201,12 +245,10 @@ Example input: "amlodipine"
 Example output: "CCB"
 If no categories match, return an empty string.
 """
-)
+classification_model = None
 
 # --- Model 2: Treatment Recommender ---
-recommendation_model = genai.GenerativeModel(
-    "gemini-2.5-flash-preview-09-2025",
-    system_instruction="""
+RECOMMENDATION_INSTRUCTION = """
 You are an expert clinical support system. Your ONLY task is to analyze a patient's situation
 and find the single best matching rule from the "Hypertension Treatment Rules" document provided.
 
@@ -221,7 +263,35 @@ Follow these strict rules:
 6. If no rule matches, respond exactly with: N/A
 7. Never add any other explanation or text besides the rule or N/A.
 """
-)
+recommendation_model = None
+
+
+def get_classification_model():
+    global classification_model
+    if classification_model is None:
+        with _model_lock:
+            if classification_model is None:
+                classification_model = build_model(CLASSIFICATION_INSTRUCTION)
+    return classification_model
+
+
+def get_recommendation_model():
+    global recommendation_model
+    if recommendation_model is None:
+        with _model_lock:
+            if recommendation_model is None:
+                recommendation_model = build_model(RECOMMENDATION_INSTRUCTION)
+    return recommendation_model
+
+
+def warm_up_models():
+    started = time.perf_counter()
+    try:
+        get_classification_model()
+        get_recommendation_model()
+        STARTUP["model_warmup_seconds"] = round(time.perf_counter() - started, 4)
+    except Exception as e:
+        print(f"⚠️ Model warm-up failed (will retry on first request): {e}")
 
 
 # --- Helper Functions ---
@@ -235,32 +305,61 @@ def get_htn_grade(systolic, diastolic):
     return "Below Grade I (Normal/Elevated/Stage 1)"
 
 
-def classify_medications(med_text):
+def get_htn_grades(systolic, diastolic):
+    """Vectorized get_htn_grade over NumPy arrays (same thresholds, same labels)."""
+    import numpy as np  # only bulk triage needs NumPy; keep it off the startup path
+
+    systolic = np.asarray(systolic, dtype=float)
+    diastolic = np.asarray(diastolic, dtype=float)
+    conditions = [
+        (systolic >= 180) | (diastolic >= 110),
+        ((systolic >= 160) & (systolic <= 179)) | ((diastolic >= 100) & (diastolic <= 109)),
+        ((systolic >= 140) & (systolic <= 159)) | ((diastolic >= 90) & (diastolic <= 99)),
+    ]
+    return np.select(conditions, ["Gr III", "Gr II", "Gr I"], default="Below Grade I (Normal/Elevated/Stage 1)")
+
+
+def classify_without_llm(med_text):
+    """Classes resolved locally, or None when only the LLM can tell."""
     if not med_text or not med_text.strip():
         return []
 
-    normalized = med_text.strip().lower()
-    if normalized in ["none", "no", "nil", "nothing", "na", "n/a", "none given", "none currently", "no meds"]:
+    if is_no_medication(med_text):
+        return []
+
+    return classify_locally(med_text) or None
+
+
+def parse_classification(response):
+    if not response or not hasattr(response, "text"):
+        return []
+    api_response = response.text.strip()
+    if not api_response:
         return []
+    return [s.strip().upper() for s in api_response.split(",") if s.strip()]
+
+
+def classify_medications(med_text):
+    local_classes = classify_without_llm(med_text)
+    if local_classes is not None:
+        return local_classes
 
     try:
-        response = classification_model.generate_content(med_text)
-        if not response or not hasattr(response, "text"):
-            return []
-        api_response = response.text.strip()
-        if not api_response:
-            return []
-        return [s.strip().upper() for s in api_response.split(",") if s.strip()]
+        response = get_classification_model().generate_content(med_text)
+        classes = parse_classification(response)
+        record_llm_call("classification", med_text, ",".join(classes))
+        return classes
     except Exception as e:
+        LLM_FAILURES.inc(stage="classification")
         print(f"Error in medication classification: {e}")
         return []
 
 
-def get_recommendation(inputs, htn_grade, classified_meds):
+def build_recommendation_prompt(inputs, htn_grade, classified_meds, rules_text):
     medication_list = ", ".join(classified_meds) if classified_meds else "None"
     patient_status = "Existing Patient" if classified_meds else "New Patient"
 
-    user_query = f"""
+    return f"""
 Patient Details:
 - Patient Age: {inputs.get('age')}
 - Blood Pressure: {inputs.get('systolic')}/{inputs.get('diastolic')} mmHg
@@ -271,39 +370,142 @@ Patient Details:
 
 RULES DOCUMENT:
 ---
-{RULES_DOCUMENT}
+{rules_text}
 ---
 """
+
+
+def prepare_recommendation_prompt(inputs, htn_grade, classified_meds, rulebook):
+    """Prompt with only the rules part (and candidate riders) relevant to this patient."""
+    rules_text, candidate_ids = rulebook.rules_excerpt(inputs.get("hasCKD"), htn_grade, classified_meds)
+    # Riders with identical IF conditions: the local table cannot choose, the model must.
+    ambiguous_ids = [rule.rule_id for rule in rulebook.matches(inputs.get("hasCKD"), htn_grade, classified_meds)]
+    if len(ambiguous_ids) > 1:
+        rules_text += (
+            f"\n\nNOTE: Rules {', '.join(ambiguous_ids)} all match this patient's IF conditions. "
+            "Choose the one that best fits the patient's age and details."
+        )
+    else:
+        ambiguous_ids = []
+    user_query = build_recommendation_prompt(inputs, htn_grade, classified_meds, rules_text)
+    full_tokens = estimate_tokens(build_recommendation_prompt(inputs, htn_grade, classified_meds, rulebook.document))
+    prompt_report = {
+        "prompt_tokens": estimate_tokens(user_query),
+        "full_document_prompt_tokens": full_tokens,
+        "tokens_saved": full_tokens - estimate_tokens(user_query),
+        "candidate_rules": candidate_ids,
+        "ambiguous_rules": ambiguous_ids,
+    }
+    return user_query, prompt_report
+
+
+def parse_recommendation(response):
+    result = response.text.strip() if response and response.text else "N/A"
+    return result if result else "N/A"
+
+
+def get_recommendation(inputs, htn_grade, classified_meds, rulebook=None):
+    rulebook = rulebook or rules_watcher.rulebook
+    user_query, prompt_report = prepare_recommendation_prompt(inputs, htn_grade, classified_meds, rulebook)
     try:
-        response = recommendation_model.generate_content(user_query)
-        result = response.text.strip() if response and response.text else "N/A"
-        return result if result else "N/A"
+        response = get_recommendation_model().generate_content(user_query)
+        recommendation = parse_recommendation(response)
+        record_llm_call("recommendation", user_query, recommendation)
+        return recommendation, prompt_report
     except Exception as e:
+        LLM_FAILURES.inc(stage="recommendation")
         print(f"⚠️ Error in recommendation generation: {e}")
         raise RuntimeError(f"Failed to get recommendation: {e}")
 
 
+def lookup_recommendation(inputs, htn_grade, classified_meds, rulebook):
+    """
+    Try the local rule table, then the scenario cache. Returns (result, cache_key);
+    result is None when the caller has to ask Gemini.
+    """
+    rule = rulebook.match(inputs.get("hasCKD"), htn_grade, classified_meds)
+    if rule:
+        return {
+            "recommendation": rule.render(), "rule_id": rule.rule_id, "source": "rules",
+            "rules_version": rulebook.version,
+        }, None
+
+    cache_key = recommendation_key(
+        rulebook.version, inputs.get("hasCKD"), htn_grade, classified_meds, inputs.get("age")
+    )
+    cached = recommendation_cache.get(cache_key)
+    if cached is not None:
+        return {
+            "recommendation": cached, "rule_id": None, "source": "cache",
+            "rules_version": rulebook.version,
+        }, cache_key
+    return None, cache_key
+
+
+def store_recommendation(cache_key, recommendation, prompt_report, rulebook):
+    recommendation_cache.set(cache_key, recommendation)
+    return {
+        "recommendation": recommendation, "rule_id": None, "source": "llm",
+        "rules_version": rulebook.version, "prompt_report": prompt_report,
+    }
+
+
+def resolve_recommendation(inputs, htn_grade, classified_meds, rulebook=None):
+    """Answer from the local rule table when possible, otherwise ask Gemini."""
+    # One RuleBook per request: a reload mid-request must not mix versions.
+    rulebook = rulebook or rules_watcher.rulebook
+    result, cache_key = lookup_recommendation(inputs, htn_grade, classified_meds, rulebook)
+    if result is not None:
+        return result
+
+    recommendation, prompt_report = get_recommendation(inputs, htn_grade, classified_meds, rulebook)
+    return store_recommendation(cache_key, recommendation, prompt_report, rulebook)
+
+
 # --- Flask Routes ---
+DEBUG_TIMINGS_HEADER = "X-Debug-Timings"
+
+
 @app.route("/")
 def serve_index():
     return send_from_directory(".", "index.html")
 
 
+def wants_debug_timings(headers):
+    """Opt-in per-stage timings in the response body: send 'X-Debug-Timings: 1'."""
+    return headers.get(DEBUG_TIMINGS_HEADER, "").lower() in ("1", "true", "yes")
+
+
 @app.route("/get-recommendation", methods=["POST"])
 def handle_recommendation():
+    timer = StageTimer()
     try:
-        inputs = request.json
+        with timer.span("parse_request"):
+            inputs = request.json
         if not all(k in inputs for k in ["age", "systolic", "diastolic"]):
             return jsonify({"error": "Missing required fields (age, systolic, diastolic)."}), 400
 
-        htn_grade = get_htn_grade(inputs["systolic"], inputs["diastolic"])
-        classified_meds = classify_medications(inputs.get("medicationsText", ""))
-        recommendation = get_recommendation(inputs, htn_grade, classified_meds)
-        return jsonify({
+        with timer.span("htn_grade"):
+            htn_grade = get_htn_grade(inputs["systolic"], inputs["diastolic"])
+        with timer.span("classify_medications"):
+            classified_meds = classify_medications(inputs.get("medicationsText", ""))
+        with timer.span("get_recommendation"):
+            result = resolve_recommendation(inputs, htn_grade, classified_meds)
+        record_result(result)
+
+        body = {
             "htn_grade": htn_grade,
             "classified_medications": classified_meds,
-            "recommendation": recommendation
-        })
+            **result
+        }
+        with timer.span("serialize_response"):
+            response = jsonify(body)
+        timings = timer.finish()
+        if wants_debug_timings(request.headers):
+            # Encoded again so the timings include serialize_response; only debug requests pay for it.
+            body["timings_ms"] = timings
+            response = jsonify(body)
+        return response
 
     except RuntimeError as e:
         return jsonify({"error": str(e)}), 500
@@ -311,7 +513,122 @@ def handle_recommendation():
         return jsonify({"error": f"Unexpected server error: {e}"}), 500
 
 
+@app.route("/bulk-triage", methods=["POST"])
+def handle_bulk_triage():
+    """
+    Triage a CSV or JSON batch of patients. Grades are computed in one
+    vectorized pass, each unique scenario is resolved once, and results
+    stream back as NDJSON in input order, followed by a summary line.
+    """
+    upload = next(iter(request.files.values()), None)
+    body = upload.read() if upload else request.get_data()
+    content_type = (upload.mimetype or upload.filename) if upload else request.content_type
+    try:
+        patients = [normalize_patient(raw) for raw in parse_patients(body, content_type)]
+    except ValueError as e:
+        return jsonify({"error": f"Could not parse batch: {e}"}), 400
+
+    valid = [p for p in patients if "error" not in p]
+    grades = iter(get_htn_grades([p["systolic"] for p in valid], [p["diastolic"] for p in valid]).tolist())
+    for patient in valid:
+        patient["htn_grade"] = next(grades)
+
+    rulebook = rules_watcher.rulebook
+
+    def generate():
+        classified_by_text = {}
+        results_by_scenario = {}
+        errors = 0
+        for index, patient in enumerate(patients):
+            if "error" in patient:
+                errors += 1
+                yield json.dumps({"index": index, "error": patient["error"]}) + "\n"
+                continue
+
+            med_key = " ".join(patient["medicationsText"].lower().split())
+            if med_key not in classified_by_text:
+                classified_by_text[med_key] = classify_medications(patient["medicationsText"])
+            classified_meds = classified_by_text[med_key]
+
+            scenario = recommendation_key(
+                rulebook.version, patient["hasCKD"], patient["htn_grade"], classified_meds, patient["age"]
+            )
+            if scenario not in results_by_scenario:
+                try:
+                    results_by_scenario[scenario] = resolve_recommendation(
+                        patient, patient["htn_grade"], classified_meds, rulebook
+                    )
+                except RuntimeError as e:
+                    results_by_scenario[scenario] = {"error": str(e)}
+            result = results_by_scenario[scenario]
+            errors += "error" in result
+            record_result(result)
+
+            yield json.dumps({
+                "index": index,
+                "htn_grade": patient["htn_grade"],
+                "classified_medications": classified_meds,
+                **result
+            }) + "\n"
+
+        yield json.dumps({"summary": {
+            "patients": len(patients),
+            "unique_scenarios": len(results_by_scenario),
+            "errors": errors,
+        }}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    return jsonify(recommendation_cache.stats())
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    cache = recommendation_cache.stats()
+    cache_lines = [
+        "# HELP bp_recommendation_cache_lookups_total Scenario cache lookups by result.",
+        "# TYPE bp_recommendation_cache_lookups_total counter",
+        f'bp_recommendation_cache_lookups_total{{result="hit"}} {cache["hits"]}',
+        f'bp_recommendation_cache_lookups_total{{result="miss"}} {cache["misses"]}',
+        "# HELP bp_recommendation_cache_entries Entries held in the in-process scenario cache.",
+        "# TYPE bp_recommendation_cache_entries gauge",
+        f'bp_recommendation_cache_entries {cache["size"]}',
+    ]
+    return Response(render_metrics(cache_lines), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/status", methods=["GET"])
+def status():
+    return jsonify({
+        "status": "ok",
+        "rules": rules_watcher.status(),
+        "startup": dict(STARTUP, models_loaded=classification_model is not None and recommendation_model is not None),
+    })
+
+
+@app.after_request
+def record_first_response(response):
+    if STARTUP["first_response_seconds"] is None:
+        STARTUP["first_response_seconds"] = round(time.perf_counter() - _IMPORT_STARTED, 4)
+    return response
+
+
+# --- Startup Timing ---
+# import_seconds: module import (SDK excluded); first_response_seconds: import
+# start until the first response was sent.
+STARTUP = {
+    "import_seconds": round(time.perf_counter() - _IMPORT_STARTED, 4),
+    "first_response_seconds": None,
+    "model_warmup_seconds": None,
+}
+if os.getenv("LLM_WARMUP", "1") == "1":
+    threading.Thread(target=warm_up_models, name="model-warmup", daemon=True).start()
+
+
 if __name__ == "__main__":
-    print("BP Advisor API Running → http://127.0.0.1:5050")
+    print(f"BP Advisor API Running → http://127.0.0.1:5050 (imported in {STARTUP['import_seconds']}s)")
     print("CORS enabled for localhost:3000")
     app.run(debug=True, host="127.0.0.1", port=5050)
\ No newline at end of file
@@ -0,0 +1,148 @@
+"""
+Async serving path for the BP Advisor
+-------------------------------------
+
+Same behaviour as app.py, but /get-recommendation runs on asyncio and uses
+the async Gemini API, so a request waiting on the model no longer holds a
+worker thread. Every LLM call shares one semaphore (bounded concurrency)
+and one per-request deadline. Routes that are not LLM-bound (/, /bulk-triage,
+/cache-stats, /metrics, /status) are served by the Flask app mounted underneath.
+
+Run (dev):
+    uvicorn asgi_app:app --port 5050
+
+Offline load testing (no API key needed):
+    LLM_BACKEND=stub STUB_LLM_LATENCY=0.5 uvicorn asgi_app:app --port 5050
+
+Environment variables:
+    LLM_MAX_CONCURRENCY=256     # in-flight model calls per process
+    LLM_DEADLINE_SECONDS=30     # budget for all model calls of one request
+"""
+
+import asyncio
+import os
+
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.wsgi import WSGIMiddleware
+from fastapi.responses import JSONResponse
+
+import app as sync_app
+from metrics import LLM_FAILURES, StageTimer, record_llm_call, record_result
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "256"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+
+app = FastAPI(title="BP Advisor API (async)")
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+_llm_semaphore = None
+
+
+def llm_semaphore():
+    # Created lazily so it binds to the running event loop.
+    global _llm_semaphore
+    if _llm_semaphore is None:
+        _llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _llm_semaphore
+
+
+async def call_model(model, prompt, deadline):
+    """Await model.generate_content_async under the shared semaphore and the request deadline."""
+    remaining = deadline - asyncio.get_running_loop().time()
+    if remaining <= 0:
+        raise asyncio.TimeoutError()
+
+    async def limited_call():
+        async with llm_semaphore():
+            return await model.generate_content_async(prompt)
+
+    return await asyncio.wait_for(limited_call(), timeout=remaining)
+
+
+async def classify_medications_async(med_text, deadline):
+    local_classes = sync_app.classify_without_llm(med_text)
+    if local_classes is not None:
+        return local_classes
+    try:
+        response = await call_model(sync_app.get_classification_model(), med_text, deadline)
+        classes = sync_app.parse_classification(response)
+        record_llm_call("classification", med_text, ",".join(classes))
+        return classes
+    except asyncio.TimeoutError:
+        # Out of time: answering as if the patient took nothing could pick a
+        # new-patient regimen for someone already treated, so let it become a 504.
+        LLM_FAILURES.inc(stage="classification")
+        raise
+    except Exception as e:
+        LLM_FAILURES.inc(stage="classification")
+        print(f"Error in medication classification: {e!r}")
+        return []
+
+
+async def resolve_recommendation_async(inputs, htn_grade, classified_meds, deadline):
+    rulebook = sync_app.rules_watcher.rulebook
+    result, cache_key = sync_app.lookup_recommendation(inputs, htn_grade, classified_meds, rulebook)
+    if result is not None:
+        return result
+
+    user_query, prompt_report = sync_app.prepare_recommendation_prompt(inputs, htn_grade, classified_meds, rulebook)
+    try:
+        response = await call_model(sync_app.get_recommendation_model(), user_query, deadline)
+    except Exception:
+        LLM_FAILURES.inc(stage="recommendation")
+        raise
+    recommendation = sync_app.parse_recommendation(response)
+    record_llm_call("recommendation", user_query, recommendation)
+    return sync_app.store_recommendation(cache_key, recommendation, prompt_report, rulebook)
+
+
+@app.post("/get-recommendation")
+async def handle_recommendation(request: Request):
+    deadline = asyncio.get_running_loop().time() + LLM_DEADLINE_SECONDS
+    timer = StageTimer()
+    try:
+        with timer.span("parse_request"):
+            inputs = await request.json()
+        if not all(k in inputs for k in ["age", "systolic", "diastolic"]):
+            return JSONResponse({"error": "Missing required fields (age, systolic, diastolic)."}, status_code=400)
+
+        with timer.span("htn_grade"):
+            htn_grade = sync_app.get_htn_grade(inputs["systolic"], inputs["diastolic"])
+        with timer.span("classify_medications"):
+            classified_meds = await classify_medications_async(inputs.get("medicationsText", ""), deadline)
+        with timer.span("get_recommendation"):
+            result = await resolve_recommendation_async(inputs, htn_grade, classified_meds, deadline)
+        record_result(result)
+
+        body = {
+            "htn_grade": htn_grade,
+            "classified_medications": classified_meds,
+            **result
+        }
+        with timer.span("serialize_response"):
+            response = JSONResponse(body)
+        timings = timer.finish()
+        if sync_app.wants_debug_timings(request.headers):
+            # Encoded again so the timings include serialize_response; only debug requests pay for it.
+            body["timings_ms"] = timings
+            response = JSONResponse(body)
+        return response
+
+    except asyncio.TimeoutError:
+        return JSONResponse(
+            {"error": f"Failed to get recommendation: no answer within {LLM_DEADLINE_SECONDS:g}s."},
+            status_code=504,
+        )
+    except Exception as e:
+        print(f"⚠️ Error in recommendation generation: {e}")
+        return JSONResponse({"error": f"Failed to get recommendation: {e}"}, status_code=500)
+
+
+# Everything else (index page, bulk triage, stats) is served by the Flask app.
+app.mount("/", WSGIMiddleware(sync_app.app))
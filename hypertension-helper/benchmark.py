@@ -0,0 +1,179 @@
+"""
+Offline benchmark for /get-recommendation
+-----------------------------------------
+
+Replays a corpus of synthetic patients through the Flask handler with
+fake Gemini models (configurable latency, jitter and error rate) in place
+of classification_model and recommendation_model, then reports
+throughput, tail latency and the per-stage breakdown. No API key or
+network access is needed.
+
+Run (from this directory):
+    python benchmark.py
+    python benchmark.py --requests 2000 --concurrency 32 --latency 0.8 --jitter 0.3 --error-rate 0.02
+    python benchmark.py --no-cache --max-p95-ms 1500     # non-zero exit if p95 regresses
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Free text the local classifier resolves, plus text only the (fake) LLM can handle.
+MEDICATION_SAMPLES = [
+    "", "none", "nil", "amlodipine 5", "Telma 40", "metoprolol XL 50", "chlorthalidone 6.25",
+    "ramipril 5 and amlodipine 5", "Amlodepine, metoprolo", "spironolactone + telmisartan",
+    "the small white tablet", "bp tablet from local clinic", "ayurvedic powder",
+]
+
+
+def synthetic_patients(count, seed):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield {
+            "age": rng.randint(18, 90),
+            "systolic": rng.randint(120, 200),
+            "diastolic": rng.randint(75, 120),
+            "hasCKD": rng.random() < 0.2,
+            "medicationsText": rng.choice(MEDICATION_SAMPLES),
+        }
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def load_app(args):
+    """Import app.py in stub mode and swap in fake models with the requested behaviour."""
+    os.chdir(HERE)
+    sys.path.insert(0, HERE)
+    os.environ["LLM_BACKEND"] = "stub"
+    os.environ.setdefault("RULES_RELOAD_INTERVAL", "0")
+    os.environ["LLM_WARMUP"] = "0"
+    if args.no_cache:
+        os.environ["RECOMMENDATION_CACHE_SIZE"] = "0"
+        os.environ.pop("RECOMMENDATION_CACHE_PATH", None)
+
+    import app as bp_app
+    from stub_model import StubGenerativeModel
+
+    fake = dict(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    bp_app.classification_model = StubGenerativeModel(
+        bp_app.MODEL_NAME, bp_app.CLASSIFICATION_INSTRUCTION, seed=args.seed, **fake
+    )
+    bp_app.recommendation_model = StubGenerativeModel(
+        bp_app.MODEL_NAME, bp_app.RECOMMENDATION_INSTRUCTION, seed=args.seed + 1, **fake
+    )
+    return bp_app
+
+
+def run(args):
+    bp_app = load_app(args)
+    patients = list(synthetic_patients(args.requests, args.seed))
+    local = threading.local()
+
+    def send(patient):
+        if not hasattr(local, "client"):
+            local.client = bp_app.app.test_client()
+        start = time.perf_counter()
+        response = local.client.post("/get-recommendation", json=patient, headers={"X-Debug-Timings": "1"})
+        elapsed = time.perf_counter() - start
+        return elapsed, response.status_code, response.get_json(silent=True) or {}
+
+    for patient in patients[:args.warmup]:
+        send(patient)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(send, patients))
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed * 1000 for elapsed, _, _ in results]
+    statuses = Counter(status for _, status, _ in results)
+    sources = Counter(body.get("source", "error") for _, _, body in results)
+    stages = defaultdict(list)
+    for _, _, body in results:
+        for stage, ms in (body.get("timings_ms") or {}).items():
+            stages[stage].append(ms)
+
+    return {
+        "requests": len(results),
+        "concurrency": args.concurrency,
+        "fake_model": {"latency_s": args.latency, "jitter_s": args.jitter, "error_rate": args.error_rate},
+        "wall_seconds": round(wall, 3),
+        "requests_per_second": round(len(results) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "max": round(max(latencies), 3) if latencies else 0.0,
+        },
+        "status_codes": dict(statuses),
+        "sources": dict(sources),
+        "stages_ms": {
+            stage: {
+                "mean": round(sum(values) / len(values), 3),
+                "p95": round(percentile(values, 0.95), 3),
+            }
+            for stage, values in sorted(stages.items())
+        },
+        "llm_calls": {
+            "classification": bp_app.classification_model.calls,
+            "recommendation": bp_app.recommendation_model.calls,
+        },
+        "cache": bp_app.recommendation_cache.stats(),
+    }
+
+
+def print_report(report):
+    print(f"Requests:     {report['requests']} @ concurrency {report['concurrency']}")
+    print(f"Fake model:   {report['fake_model']}")
+    print(f"Throughput:   {report['requests_per_second']} req/s ({report['wall_seconds']} s wall)")
+    lat = report["latency_ms"]
+    print(f"Latency (ms): p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}")
+    print(f"Status codes: {report['status_codes']}")
+    print(f"Sources:      {report['sources']}")
+    print(f"LLM calls:    {report['llm_calls']}")
+    print(f"Cache:        hits {report['cache']['hits']}, misses {report['cache']['misses']}")
+    print("Stages (ms):")
+    for stage, values in report["stages_ms"].items():
+        print(f"  {stage:<22} mean {values['mean']:>10}  p95 {values['p95']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /get-recommendation against a fake Gemini backend.")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.25, help="fake model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="+/- uniform jitter in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake calls that fail")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--warmup", type=int, default=10, help="requests sent before timing starts")
+    parser.add_argument("--no-cache", action="store_true", help="disable the scenario cache")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--max-p95-ms", type=float, help="exit 1 if p95 latency exceeds this")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.max_p95_ms is not None and report["latency_ms"]["p95"] > args.max_p95_ms:
+        print(f"❌ p95 {report['latency_ms']['p95']} ms exceeds budget {args.max_p95_ms} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Bulk triage input parsing
+-------------------------
+
+Screening camps upload many readings at once, either as a JSON array of
+the same objects /get-recommendation accepts or as CSV with the columns
+age, systolic, diastolic, hasCKD, medicationsText.
+"""
+
+import csv
+import io
+import json
+from typing import Any, Dict, List
+
+REQUIRED_FIELDS = ["age", "systolic", "diastolic"]
+TRUTHY = {"1", "true", "yes", "y", "t"}
+
+
+def parse_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in TRUTHY
+    return bool(value)
+
+
+def parse_number(value):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def parse_patients(body: bytes, content_type: str) -> List[Dict[str, Any]]:
+    """Decode a CSV or JSON upload into a list of raw patient dicts."""
+    text = body.decode("utf-8-sig")
+    if "csv" in (content_type or "") or not text.lstrip().startswith(("[", "{")):
+        return [dict(row) for row in csv.DictReader(io.StringIO(text))]
+
+    payload = json.loads(text)
+    if isinstance(payload, dict):
+        payload = payload.get("patients", [])
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of patients or {\"patients\": [...]}.")
+    return payload
+
+
+def medications_text(value) -> str:
+    """JSON rows may carry a list of medications or a bare number; the classifier needs a string."""
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value if item is not None)
+    return str(value)
+
+
+def normalize_patient(raw) -> Dict[str, Any]:
+    """Coerce one raw row; sets 'error' instead of raising when fields are missing."""
+    if not isinstance(raw, dict):
+        return {"error": "Patient entry must be an object."}
+    patient = {
+        "age": parse_number(raw.get("age")),
+        "systolic": parse_number(raw.get("systolic")),
+        "diastolic": parse_number(raw.get("diastolic")),
+        "hasCKD": parse_bool(raw.get("hasCKD", False)),
+        "medicationsText": medications_text(raw.get("medicationsText")),
+    }
+    missing = [k for k in REQUIRED_FIELDS if patient[k] is None]
+    if missing:
+        patient["error"] = f"Missing or invalid fields: {', '.join(missing)}."
+    return patient
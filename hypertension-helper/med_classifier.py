@@ -0,0 +1,171 @@
+"""
+Local medication classifier
+---------------------------
+
+Maps free medication text ("metoprolol and ramipril", "Telma 40, amlong")
+to the class abbreviations used by bp-rules.txt without an LLM call.
+Generic and brand names live in a trie; each word of the input is looked
+up exactly and, failing that, within a small edit distance of a generic
+name so common misspellings ("amlodepine", "metoprolo") still resolve.
+Brand names are exact-only: they are short enough to sit one edit away
+from ordinary words.
+"""
+
+import re
+from typing import Dict, List, Optional, Set
+
+NO_MEDICATION_PHRASES = {
+    "none", "no", "nil", "nothing", "na", "n/a", "none given", "none currently", "no meds",
+}
+
+# Class abbreviations match the classification_model system prompt (upper-cased,
+# as classify_medications has always returned them).
+GENERIC_LEXICON: Dict[str, List[str]] = {
+    "CCB": [
+        "amlodipine", "nifedipine", "benidipine", "cilnidipine", "efonidipine", "felodipine",
+        "lercanidipine", "nicardipine", "diltiazem", "verapamil",
+    ],
+    "RASI": [
+        "telmisartan", "losartan", "olmesartan", "valsartan", "candesartan", "irbesartan", "azilsartan",
+        "ramipril", "enalapril", "lisinopril", "perindopril", "captopril", "sacubitril",
+    ],
+    "DIURETICS": [
+        "hydrochlorothiazide", "hydrochlorthiazide", "chlorthalidone", "indapamide", "torsemide",
+        "furosemide", "metolazone",
+    ],
+    "BB": [
+        "metoprolol", "atenolol", "bisoprolol", "nebivolol", "carvedilol", "labetalol", "propranolol",
+    ],
+    "MRA": ["spironolactone", "eplerenone"],
+    "AB": ["prazosin", "doxazosin", "terazosin"],
+    "CA": ["clonidine", "methyldopa", "moxonidine"],
+}
+
+# Brand names and abbreviations are short and close to everyday words
+# ("repace"/"replace", "lasix"/"lasik"), so they only ever match exactly.
+BRAND_LEXICON: Dict[str, List[str]] = {
+    "CCB": [
+        "amlong", "amlokind", "stamlo", "amlopres", "norvasc", "amlip", "cilacar", "depin",
+        "calcigard", "dilzem", "calaptin",
+    ],
+    "RASI": [
+        "arni", "telma", "telmikind", "micardis", "losar", "losacar", "repace", "cozaar", "olmezest",
+        "benicar", "diovan", "entresto", "vymada", "cardace", "ramistar", "envas", "zestril", "coversyl",
+    ],
+    "DIURETICS": ["hctz", "aquazide", "thalizide", "natrilix", "dytor", "lasix"],
+    "BB": [
+        "metolar", "betaloc", "lopressor", "toprol", "aten", "tenormin", "concor", "nebicard",
+        "nebistar", "carloc", "cardivas", "inderal", "ciplar",
+    ],
+    "MRA": ["aldactone", "eptus"],
+    "AB": ["minipress", "prazopress", "doxacard"],
+    "CA": ["catapres", "arkamin", "aldomet", "dopegyt"],
+}
+
+# Fixed-dose combinations written as one word once hyphens are dropped ("Telma-AM").
+COMBINATION_LEXICON: Dict[str, List[str]] = {
+    "telmaam": ["RASI", "CCB"],
+    "telmah": ["RASI", "DIURETICS"],
+    "telmact": ["RASI", "DIURETICS"],
+    "losarh": ["RASI", "DIURETICS"],
+    "amlokindat": ["CCB", "BB"],
+    "stamloam": ["CCB"],
+    "metolaram": ["BB", "CCB"],
+}
+
+MIN_FUZZY_LENGTH = 5
+WORD_REGEX = re.compile(r"[a-z]+(?:-[a-z]+)*")
+
+_TERMINAL = "$"
+
+
+def max_edits_for(word: str) -> int:
+    if len(word) < MIN_FUZZY_LENGTH:
+        return 0
+    return 1 if len(word) < 9 else 2
+
+
+class MedicationTrie:
+    def __init__(self):
+        self.root: Dict = {}
+
+    def insert(self, word: str, classes: List[str]):
+        node = self.root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node.setdefault(_TERMINAL, [])
+        for cls in classes:
+            if cls not in node[_TERMINAL]:
+                node[_TERMINAL].append(cls)
+
+    def exact(self, word: str) -> Optional[List[str]]:
+        node = self.root
+        for ch in word:
+            node = node.get(ch)
+            if node is None:
+                return None
+        return node.get(_TERMINAL)
+
+    def fuzzy(self, word: str, max_edits: int) -> Optional[List[str]]:
+        """Closest entry within max_edits (Levenshtein), walking the trie row by row."""
+        best = [max_edits + 1, None]
+        first_row = list(range(len(word) + 1))
+
+        def walk(node, ch, previous_row):
+            row = [previous_row[0] + 1]
+            for i in range(1, len(word) + 1):
+                row.append(min(
+                    row[i - 1] + 1,
+                    previous_row[i] + 1,
+                    previous_row[i - 1] + (word[i - 1] != ch),
+                ))
+            if _TERMINAL in node and row[-1] < best[0]:
+                best[0], best[1] = row[-1], node[_TERMINAL]
+            if min(row) < best[0]:
+                for next_ch, child in node.items():
+                    if next_ch != _TERMINAL:
+                        walk(child, next_ch, row)
+
+        for ch, child in self.root.items():
+            if ch != _TERMINAL:
+                walk(child, ch, first_row)
+        return best[1]
+
+
+def build_trie(*lexicons: Dict[str, List[str]], combinations: Optional[Dict[str, List[str]]] = None) -> MedicationTrie:
+    trie = MedicationTrie()
+    for lexicon in lexicons:
+        for cls, names in lexicon.items():
+            for name in names:
+                trie.insert(name, [cls])
+    for name, classes in (combinations or {}).items():
+        trie.insert(name, classes)
+    return trie
+
+
+# Exact lookups see every name; misspellings are only corrected towards generics.
+MEDICATION_TRIE = build_trie(GENERIC_LEXICON, BRAND_LEXICON, combinations=COMBINATION_LEXICON)
+GENERIC_TRIE = build_trie(GENERIC_LEXICON)
+
+
+def is_no_medication(med_text: str) -> bool:
+    return med_text.strip().lower() in NO_MEDICATION_PHRASES
+
+
+def classify_locally(med_text: str) -> List[str]:
+    """Return matched class abbreviations in order of first mention ([] if nothing matched)."""
+    found: List[str] = []
+    seen: Set[str] = set()
+    for token in WORD_REGEX.findall(med_text.lower()):
+        words = [token.replace("-", "")] + (token.split("-") if "-" in token else [])
+        for word in words:
+            classes = MEDICATION_TRIE.exact(word)
+            if classes is None and max_edits_for(word):
+                classes = GENERIC_TRIE.fuzzy(word, max_edits_for(word))
+            if classes:
+                for cls in classes:
+                    if cls not in seen:
+                        seen.add(cls)
+                        found.append(cls)
+                break
+    return found
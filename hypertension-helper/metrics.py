@@ -0,0 +1,165 @@
+"""
+In-process metrics for the recommendation pipeline
+--------------------------------------------------
+
+Small Prometheus-text-format registry (no client library needed):
+counters, and histograms that also report p50/p95/p99 over a sliding
+window of recent observations. StageTimer wraps each pipeline stage so
+one request's timings can be returned inline for debugging.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW_SIZE = 2048
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class _Series:
+    def __init__(self, buckets):
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self.window = deque(maxlen=WINDOW_SIZE)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: Dict[Tuple, _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series.bucket_counts[i] += 1
+            series.count += 1
+            series.total += value
+            series.window.append(value)
+
+    def quantiles(self, **labels) -> Dict[float, float]:
+        with self._lock:
+            series = self._series.get(tuple(sorted(labels.items())))
+            window = sorted(series.window) if series else []
+        if not window:
+            return {}
+        return {q: window[min(len(window) - 1, int(q * len(window)))] for q in QUANTILES}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        quantile_lines = [
+            f"# HELP {self.name}_quantile p50/p95/p99 of the last {WINDOW_SIZE} observations.",
+            f"# TYPE {self.name}_quantile gauge",
+        ]
+        with self._lock:
+            snapshot = [(key, list(s.bucket_counts), s.count, s.total, sorted(s.window))
+                        for key, s in sorted(self._series.items())]
+        for key, bucket_counts, count, total, window in snapshot:
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': str(bound)})} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+            for q in QUANTILES:
+                value = window[min(len(window) - 1, int(q * len(window)))]
+                quantile_lines.append(
+                    f"{self.name}_quantile{_format_labels(key, {'quantile': str(q)})} {_format_value(value)}"
+                )
+        return lines + quantile_lines
+
+
+STAGE_SECONDS = Histogram("bp_stage_duration_seconds", "Time spent in each recommendation pipeline stage.")
+LLM_PROMPT_CHARS = Histogram("bp_llm_prompt_chars", "Characters sent to the model per call.", SIZE_BUCKETS)
+LLM_RESPONSE_CHARS = Histogram("bp_llm_response_chars", "Characters returned by the model per call.", SIZE_BUCKETS)
+LLM_FAILURES = Counter("bp_llm_failures_total", "Model calls that raised or timed out.")
+RECOMMENDATIONS = Counter("bp_recommendations_total", "Recommendations served, by source.")
+RECOMMENDATION_NA = Counter("bp_recommendation_na_total", "Recommendations that came back as N/A.")
+
+REGISTRY = [STAGE_SECONDS, LLM_PROMPT_CHARS, LLM_RESPONSE_CHARS, LLM_FAILURES, RECOMMENDATIONS, RECOMMENDATION_NA]
+
+
+class StageTimer:
+    """Times the stages of one request; every span also feeds STAGE_SECONDS."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[stage] = self.timings.get(stage, 0.0) + elapsed
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+
+    def finish(self) -> Dict[str, float]:
+        """Record the total and return all timings in milliseconds."""
+        total = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(total, stage="total")
+        timings = dict(self.timings, total=total)
+        return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+
+def record_llm_call(stage: str, prompt: str, response_text: str):
+    LLM_PROMPT_CHARS.observe(len(prompt or ""), stage=stage)
+    LLM_RESPONSE_CHARS.observe(len(response_text or ""), stage=stage)
+
+
+def record_result(result: dict):
+    RECOMMENDATIONS.inc(source=result.get("source", "error"))
+    if result.get("recommendation") == "N/A":
+        RECOMMENDATION_NA.inc()
+
+
+def render_metrics(extra_lines: Optional[List[str]] = None) -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra_lines or [])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,323 @@
+"""
+Local rule engine for bp-rules.txt
+----------------------------------
+
+Parses the hypertension rules document once into a decision table keyed on
+(CKD flag, HTN grade, patient status, current medication classes) so that
+requests matching a rule can be answered without an LLM round trip. The
+document is also split into its parts and rule blocks so the LLM fallback
+only receives the rules that could apply to the patient.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple, FrozenSet
+
+RULE_HEADER_REGEX = re.compile(r"^Rule(?: \(Rider\))? ID:\s*(\S+)\s*$")
+PART_HEADER_REGEX = re.compile(r"^Part (\d+):")
+RULE_HEADER_REGEX_MULTILINE = re.compile(r"^Rule(?: \(Rider\))? ID:", re.MULTILINE)
+GRADE_NUMERALS = {"I": "Gr I", "II": "Gr II", "III": "Gr III"}
+GRADE_ORDER = ["I", "II", "III"]
+
+NEW_PATIENT = "New"
+EXISTING_PATIENT = "Existing"
+
+
+class Rule(NamedTuple):
+    rule_id: str
+    has_ckd: bool
+    grades: FrozenSet[str]
+    status: Optional[str]
+    meds: Optional[FrozenSet[str]]
+    other_conditions: Optional[str]
+    action: Optional[str]
+    recommendation: Optional[str]
+    text: str
+
+    def render(self) -> str:
+        """Format the rule exactly like the LLM is asked to answer."""
+        return f"THEN (Action): {self.action}\nRECOMMENDATION (Output): {self.recommendation}"
+
+
+ScenarioKey = Tuple[bool, str, str, FrozenSet[str]]
+
+
+class RuleBook:
+    """Parsed rules document plus its decision table."""
+
+    def __init__(self, document: str):
+        self.document = document
+        self.version = hashlib.sha256(document.encode("utf-8")).hexdigest()[:12]
+        self.rules = parse_rules(document)
+        self.table: Dict[ScenarioKey, List[Rule]] = build_decision_table(self.rules)
+        self.parts: Dict[str, str] = split_parts(document)
+
+    def matches(self, has_ckd: bool, htn_grade: str, classified_meds: List[str]) -> List[Rule]:
+        """Every indexed rule whose IF conditions fit this scenario, in document order."""
+        return list(self.table.get(scenario_key(has_ckd, htn_grade, classified_meds), []))
+
+    def match(self, has_ckd: bool, htn_grade: str, classified_meds: List[str]) -> Optional[Rule]:
+        """
+        The rule for this scenario when exactly one matches. Several riders
+        can share identical IF conditions with different actions; those
+        scenarios return None and are left to the LLM.
+        """
+        candidates = self.matches(has_ckd, htn_grade, classified_meds)
+        return candidates[0] if len(candidates) == 1 else None
+
+    def candidate_rules(self, has_ckd: bool, htn_grade: str, classified_meds: List[str]) -> List[Rule]:
+        """Rules from the relevant part whose grade and patient status fit the scenario."""
+        is_new = not normalize_med_classes(classified_meds)
+        return [
+            rule for rule in self.rules
+            if rule.has_ckd == bool(has_ckd)
+            and htn_grade in rule.grades
+            and (rule.status == NEW_PATIENT) == is_new
+        ]
+
+    def rules_excerpt(self, has_ckd: bool, htn_grade: str, classified_meds: List[str]) -> Tuple[str, List[str]]:
+        """
+        Prompt-ready slice of the document: the matching part's heading and
+        guidance plus only the candidate rule blocks. Falls back to the whole
+        part when no rule block is a candidate.
+        """
+        part_text = self.parts.get("2" if has_ckd else "1", self.document)
+        candidates = self.candidate_rules(has_ckd, htn_grade, classified_meds)
+        if not candidates:
+            return compact_lines(part_text), []
+
+        first_rule = RULE_HEADER_REGEX_MULTILINE.search(part_text)
+        preamble = part_text[:first_rule.start()] if first_rule else part_text.splitlines()[0]
+        sections = [compact_lines(preamble)] + [rule.text for rule in candidates]
+        special_start = part_text.find("Special Rule")
+        if special_start != -1:
+            sections.append(compact_lines(part_text[special_start:]))
+        return "\n\n".join(sections), [rule.rule_id for rule in candidates]
+
+
+def normalize_med_classes(classified_meds) -> FrozenSet[str]:
+    return frozenset(m.strip().upper() for m in classified_meds or [] if m and m.strip())
+
+
+def scenario_key(has_ckd, htn_grade, classified_meds) -> ScenarioKey:
+    meds = normalize_med_classes(classified_meds)
+    status = EXISTING_PATIENT if meds else NEW_PATIENT
+    return bool(has_ckd), htn_grade, status, meds
+
+
+def parse_grades(value: str) -> FrozenSet[str]:
+    """'Gr II-III' -> {'Gr II', 'Gr III'}; 'Gr I -II' -> {'Gr I', 'Gr II'}; 'Gr I-' -> {'Gr I'}."""
+    numerals = [n for n in re.sub(r"^Gr\s*", "", value.strip()).replace(" ", "").split("-") if n]
+    numerals = [n for n in numerals if n in GRADE_NUMERALS]
+    if not numerals:
+        return frozenset()
+    if len(numerals) == 1:
+        return frozenset({GRADE_NUMERALS[numerals[0]]})
+    start, end = GRADE_ORDER.index(numerals[0]), GRADE_ORDER.index(numerals[-1])
+    return frozenset(GRADE_NUMERALS[n] for n in GRADE_ORDER[start:end + 1])
+
+
+def parse_conditions(if_line: str) -> Dict[str, str]:
+    conditions: Dict[str, str] = {}
+    for clause in if_line.split(";"):
+        if ":" not in clause:
+            continue
+        key, value = clause.split(":", 1)
+        conditions[key.strip().lower()] = value.strip()
+    return conditions
+
+
+def parse_rule_block(rule_id: str, has_ckd: bool, lines: List[str]) -> Rule:
+    fields: Dict[str, str] = {}
+    for line in lines:
+        for prefix, name in (("IF:", "if"), ("THEN (Action):", "action"), ("RECOMMENDATION (Output):", "recommendation")):
+            if line.startswith(prefix):
+                fields[name] = line[len(prefix):].strip()
+
+    conditions = parse_conditions(fields.get("if", ""))
+    meds = None
+    if "current meds" in conditions:
+        meds = normalize_med_classes(
+            re.sub(r"\(y\)", "", m, flags=re.IGNORECASE) for m in conditions["current meds"].split(",")
+        )
+    status = conditions.get("patient status")
+    return Rule(
+        rule_id=rule_id,
+        has_ckd=has_ckd,
+        grades=parse_grades(conditions.get("htn grade", "")),
+        status=NEW_PATIENT if status and status.lower() == "new" else status,
+        meds=meds,
+        other_conditions=conditions.get("other conditions"),
+        action=fields.get("action"),
+        recommendation=fields.get("recommendation"),
+        text="\n".join(lines).strip(),
+    )
+
+
+def split_parts(document: str) -> Dict[str, str]:
+    """Split the document on its 'Part N:' headings; returns {'1': text, '2': text, ...}."""
+    parts: Dict[str, str] = {}
+    starts = [(m.group(1), m.start()) for m in re.finditer(r"^Part (\d+):", document, re.MULTILINE)]
+    for index, (number, start) in enumerate(starts):
+        end = starts[index + 1][1] if index + 1 < len(starts) else len(document)
+        parts[number] = document[start:end].strip()
+    return parts
+
+
+def compact_lines(text: str) -> str:
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Gemini token count (~4 characters per token) without a network call."""
+    return (len(text) + 3) // 4
+
+
+def parse_rules(document: str) -> List[Rule]:
+    """Parse every 'Rule (Rider) ID' / 'Rule ID' block from Part 1 and Part 2."""
+    rules: List[Rule] = []
+    part = None
+    current_id = None
+    block: List[str] = []
+
+    def flush():
+        if current_id is not None and part in ("1", "2"):
+            rules.append(parse_rule_block(current_id, part == "2", block))
+
+    for raw_line in document.splitlines():
+        line = raw_line.strip()
+        part_match = PART_HEADER_REGEX.match(line)
+        header_match = RULE_HEADER_REGEX.match(line)
+        if part_match or header_match or line.startswith("Special Rule"):
+            flush()
+            current_id, block = None, []
+            if part_match:
+                part = part_match.group(1)
+            elif header_match:
+                current_id = header_match.group(1)
+                block = [line]
+            continue
+        if current_id is not None and line:
+            block.append(line)
+    flush()
+    return rules
+
+
+def build_decision_table(rules: List[Rule]) -> Dict[ScenarioKey, List[Rule]]:
+    """
+    Index rules whose IF conditions fully describe a scenario. Rules without a
+    status or medication condition, or with extra conditions we cannot
+    observe, are left to the LLM fallback. A key can hold several riders;
+    RuleBook.match only answers locally when it holds exactly one.
+    """
+    table: Dict[ScenarioKey, List[Rule]] = {}
+    for rule in rules:
+        if not rule.grades or rule.other_conditions or not rule.action or not rule.recommendation:
+            continue
+        if rule.status == NEW_PATIENT and not rule.meds:
+            status, meds = NEW_PATIENT, frozenset()
+        elif rule.status is None and rule.meds:
+            status, meds = EXISTING_PATIENT, rule.meds
+        else:
+            continue
+        for grade in rule.grades:
+            table.setdefault((rule.has_ckd, grade, status, meds), []).append(rule)
+    return table
+
+
+def load_rulebook(path: str) -> RuleBook:
+    with open(path, "r", encoding="utf-8") as f:
+        return RuleBook(f.read())
+
+
+def rulebook_problem(rulebook: RuleBook) -> Optional[str]:
+    """Why a parsed document is not fit to serve (empty, or missing a part), or None."""
+    if not rulebook.rules:
+        return "no rules parsed"
+    for part, has_ckd in (("1", False), ("2", True)):
+        if part not in rulebook.parts:
+            return f"Part {part} is missing"
+        if not any(rule.has_ckd == has_ckd for rule in rulebook.rules):
+            return f"Part {part} has no rules"
+    return None
+
+
+class RulesWatcher:
+    """
+    Keeps the active RuleBook in sync with the rules file. A background
+    thread polls the file's mtime; on change the new file is parsed and
+    indexed off the request path and then swapped in with a single
+    reference assignment, so requests that already hold the old RuleBook
+    finish on it. A file that parses to no rules, or lacks Part 1 or
+    Part 2, is rejected and the old RuleBook stays active.
+    """
+
+    def __init__(self, path: str, interval: float = 2.0):
+        self.path = path
+        self.interval = interval
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+        self._mtime = os.stat(path).st_mtime_ns
+        self._rulebook = load_rulebook(path)
+        self.loaded_at = time.time()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def rulebook(self) -> RuleBook:
+        return self._rulebook
+
+    def check(self) -> bool:
+        """Reload if the file changed; returns True when a new version was swapped in."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._mtime:
+                return False
+            rulebook = load_rulebook(self.path)
+        except (OSError, UnicodeDecodeError) as e:
+            self.last_error = str(e)
+            print(f"⚠️ Could not reload {self.path}: {e}")
+            return False
+
+        self._mtime = mtime
+        problem = rulebook_problem(rulebook)
+        if problem:
+            # Usually a file caught mid-save; the next write changes the mtime again.
+            self.last_error = f"rejected rules version {rulebook.version}: {problem}"
+            print(f"⚠️ Not reloading {self.path}: {problem}; keeping version {self._rulebook.version}")
+            return False
+        self.last_error = None
+        if rulebook.version == self._rulebook.version:
+            return False
+        self._rulebook = rulebook
+        self.loaded_at = time.time()
+        self.reloads += 1
+        print(f"Reloaded {self.path} → rules version {rulebook.version}")
+        return True
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return
+
+        def poll():
+            while True:
+                time.sleep(self.interval)
+                self.check()
+
+        self._thread = threading.Thread(target=poll, name="rules-watcher", daemon=True)
+        self._thread.start()
+
+    def status(self) -> dict:
+        rulebook = self._rulebook
+        return {
+            "rules_version": rulebook.version,
+            "rules_path": self.path,
+            "rules_count": len(rulebook.rules),
+            "indexed_scenarios": len(rulebook.table),
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "poll_interval_seconds": self.interval,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,114 @@
+"""
+Scenario-keyed recommendation cache
+-----------------------------------
+
+get_recommendation only depends on a small discrete scenario (CKD flag,
+HTN grade, patient status, medication classes, age band), so identical
+scenarios can reuse an earlier Gemini answer. Keys include the rules
+document version, so editing bp-rules.txt invalidates old entries.
+
+The in-process tier is a bounded LRU with a TTL; an optional SQLite file
+keeps answers across restarts and between workers.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+def age_band(age) -> str:
+    """Bands follow the target BP guidelines at the top of bp-rules.txt."""
+    try:
+        age = float(age)
+    except (TypeError, ValueError):
+        return "unknown"
+    if age < 18:
+        return "<18"
+    if age < 65:
+        return "18-64"
+    if age < 80:
+        return "65-79"
+    return "80+"
+
+
+def recommendation_key(rules_version, has_ckd, htn_grade, classified_meds, age) -> Tuple:
+    meds = tuple(sorted({m.strip().upper() for m in classified_meds or [] if m and m.strip()}))
+    status = "Existing" if meds else "New"
+    return rules_version, bool(has_ckd), htn_grade, status, meds, age_band(age)
+
+
+class ScenarioCache:
+    def __init__(self, maxsize=1024, ttl=86400, path=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS recommendations (key TEXT PRIMARY KEY, stored_at REAL, value TEXT)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def _encode(key) -> str:
+        return json.dumps(key, separators=(",", ":"))
+
+    def get(self, key) -> Optional[Any]:
+        encoded = self._encode(key)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(encoded)
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT stored_at, value FROM recommendations WHERE key = ?", (encoded,)
+                ).fetchone()
+                if row:
+                    entry = (row[0], json.loads(row[1]))
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._remember(encoded, entry)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._entries.pop(encoded, None)
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        encoded = self._encode(key)
+        now = time.time()
+        with self._lock:
+            self._remember(encoded, (now, value))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO recommendations (key, stored_at, value) VALUES (?, ?, ?)",
+                    (encoded, now, json.dumps(value)),
+                )
+                self._db.execute("DELETE FROM recommendations WHERE stored_at < ?", (now - self.ttl,))
+                self._db.commit()
+
+    def _remember(self, encoded: str, entry: Tuple[float, Any]) -> None:
+        self._entries[encoded] = entry
+        self._entries.move_to_end(encoded)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "persistent": self._db is not None,
+            }
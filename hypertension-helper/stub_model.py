@@ -0,0 +1,62 @@
+"""
+Offline stand-in for google.generativeai.GenerativeModel
+--------------------------------------------------------
+
+Selected with LLM_BACKEND=stub so the service can be load-tested without
+an API key or quota. Supports both generate_content and
+generate_content_async. STUB_LLM_LATENCY / STUB_LLM_JITTER (seconds) and
+STUB_LLM_ERROR_RATE (0-1) shape the simulated upstream; benchmark.py builds
+instances directly with its own settings.
+"""
+
+import asyncio
+import os
+import random
+import time
+
+STUB_RECOMMENDATION = "THEN (Action): Stub action\nRECOMMENDATION (Output): Stub recommendation"
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModelError(Exception):
+    pass
+
+
+class StubGenerativeModel:
+    def __init__(self, model_name, system_instruction=None, latency=None, jitter=None, error_rate=None,
+                 text=None, seed=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction or ""
+        self.latency = float(os.getenv("STUB_LLM_LATENCY", "0.5")) if latency is None else latency
+        self.jitter = float(os.getenv("STUB_LLM_JITTER", "0")) if jitter is None else jitter
+        self.error_rate = float(os.getenv("STUB_LLM_ERROR_RATE", "0")) if error_rate is None else error_rate
+        if text is None:
+            # The classifier answers "no classes"; the recommender answers a fixed rule.
+            text = "" if "classifier" in self.system_instruction else STUB_RECOMMENDATION
+        self.text = text
+        self.calls = 0
+        self._random = random.Random(seed)
+
+    def _next_outcome(self):
+        """Delay for this call, and whether it should fail like an upstream 503."""
+        self.calls += 1
+        delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        return delay, self._random.random() < self.error_rate
+
+    def generate_content(self, contents):
+        delay, failed = self._next_outcome()
+        time.sleep(delay)
+        if failed:
+            raise StubModelError("503 Service Unavailable (simulated)")
+        return StubResponse(self.text)
+
+    async def generate_content_async(self, contents):
+        delay, failed = self._next_outcome()
+        await asyncio.sleep(delay)
+        if failed:
+            raise StubModelError("503 Service Unavailable (simulated)")
+        return StubResponse(self.text)
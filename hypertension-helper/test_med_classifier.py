@@ -0,0 +1,20 @@
+"""Local medication classification: exact brand names, fuzzy generic names."""
+
+from med_classifier import classify_locally
+
+
+def test_misspelled_generic_still_resolves():
+    assert classify_locally("Amlodepine 5 mg") == ["CCB"]
+    assert classify_locally("metoprolo and ramipril") == ["BB", "RASI"]
+
+
+def test_brand_names_match_only_exactly():
+    assert classify_locally("Lasix 40") == ["DIURETICS"]
+    assert classify_locally("Telma-AM") == ["RASI", "CCB"]
+    # One edit away from repace / lasix / concor / diovan.
+    for text in ("replace", "lasik", "concur", "divan"):
+        assert classify_locally(text) == [], text
+
+
+def test_text_without_a_drug_name_has_no_classes():
+    assert classify_locally("takes a vitamin every morning after breakfast") == []
@@ -0,0 +1,28 @@
+"""Local rule matching against the shipped bp-rules.txt."""
+
+import os
+
+from rule_engine import RuleBook, load_rulebook, rulebook_problem
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bp-rules.txt")
+
+
+def test_unambiguous_scenario_returns_its_rule():
+    rulebook = load_rulebook(RULES_PATH)
+    assert rulebook.match(False, "Gr III", ["CCB"]).rule_id == "7"
+    assert rulebook.match(True, "Gr I", []).rule_id == "K-1"
+
+
+def test_ambiguous_scenario_is_left_to_the_llm():
+    rulebook = load_rulebook(RULES_PATH)
+    # Several riders share these IF conditions but differ in their actions.
+    assert [rule.rule_id for rule in rulebook.matches(False, "Gr I", ["BB"])] == ["6", "14", "22", "26", "34", "40"]
+    assert rulebook.match(False, "Gr I", ["BB"]) is None
+
+
+def test_empty_or_partial_document_is_rejected():
+    with open(RULES_PATH, encoding="utf-8") as f:
+        document = f.read()
+    assert rulebook_problem(RuleBook(document)) is None
+    assert rulebook_problem(RuleBook("")) == "no rules parsed"
+    assert rulebook_problem(RuleBook(document[:document.index("Part 2:")])) == "Part 2 is missing"